@@ -0,0 +1,120 @@
+''' This runfile tests whether an alternative engine of the
+    multi-agent system model is equivalent to the reference
+    engine. Both engines are run for many seeds in every cell
+    of a small grid of neighborhood sizes and mobility rates,
+    and the distributions of every model reporter are compared.
+    The speedup is timed by running the first seed of every cell
+    once more with both engines, one after the other. Agent
+    classes that are not supported by both engines are skipped.
+    The comparison is written to a .csv file, and the exit code
+    is 1 if any reporter failed. With --exact, both engines are
+    instead run once with a fixed seed in every cell, and every
+    reporter must have exactly the same values, as for the
+    vectorized and compiled engine, which draw the same random
+    numbers.
+'''
+
+import argparse
+import sys
+
+import pandas as pd
+
+from trust.engines import ENGINES
+from utils.benchmark import supports
+from utils.equivalence import compare_engines, same_results
+from utils.sweep import grid
+
+
+N = 500 #number of agents
+n_min = 10 #minimal neighborhood size
+n_max = 50 #maximum neighborhood size
+n_stepsize = 40 #step size in which neighborhood size is changes
+mob_rate_min = 0.1 #minimum mobility rate
+mob_rate_max = 0.5 #maximum mobility rate
+mob_rate_stepsize = 0.4 #step size in which mobility is changed
+
+AGENT_ARGS = {
+    'MSAgent': {},
+    'WHAgent': {},
+    'RLAgent': {'learning_rate': 0.02, 'social_learning_rate': 0.5, 'discount_factor': 0.8, 'relative_reward': True},
+    'GossipAgent': {'memory_size': 25},
+    'RLGossipAgent': {'learning_rate': 0.05, 'social_learning_rate': 0.5, 'discount_factor': 0.8, 'relative_reward': True, 'memory_size': 25},
+}
+
+#specify the number of epochs before and after strarting to record values
+run_args = {'T_onset': 100, 'T_record': 100}
+
+
+def parse_compare_args():
+    parser = argparse.ArgumentParser(description='Tests whether an engine of the MAS for trust in exchange is equivalent to a reference engine')
+    parser.add_argument('output', help='Writes to OUTPUT.csv')
+    # Validated below, as argparse rejects an empty list with choices
+    parser.add_argument('agent_classes', nargs='*', metavar='agent_class',
+                        help='The agent classes to compare, from {' + ','.join(AGENT_ARGS) + '} (default: all)')
+    parser.add_argument('--reference', default='agent', choices=list(ENGINES))
+    parser.add_argument('--alternative', default='vectorized', choices=list(ENGINES))
+    parser.add_argument('-R', '--replicates', default=30, type=int,
+                        help='Number of seeds run by both engines in every cell')
+    parser.add_argument('--alpha', default=0.05, type=float,
+                        help='Probability that any reporter fails while the engines are equivalent')
+    parser.add_argument('-w', '--workers', default=None, type=int,
+                        help='Number of worker processes (default: number of cores)')
+    parser.add_argument('-s', '--seed', default=None, type=int,
+                        help='Seed from which the seeds of the replicates are derived')
+    parser.add_argument('--exact', action='store_true',
+                        help='Checks that both engines give exactly the same results for a fixed seed (default seed 0), instead of comparing distributions')
+    args = parser.parse_args()
+
+    unknown = [agent_class for agent_class in args.agent_classes if agent_class not in AGENT_ARGS]
+    if unknown:
+        parser.error(f'invalid agent classes: {unknown}')
+    return args
+
+
+def main():
+    args = parse_compare_args()
+    agent_classes = []
+    for agent_class in args.agent_classes or list(AGENT_ARGS):
+        unsupported = [engine for engine in (args.reference, args.alternative) if not supports(engine, agent_class)]
+        if unsupported:
+            print(f"Skipping {agent_class}: not supported by the {' and '.join(unsupported)} engine")
+        else:
+            agent_classes.append(agent_class)
+    if not agent_classes:
+        print("No agent class is supported by both engines")
+        sys.exit(1)
+
+    cells = [{'neighbourhood_size': int(n), 'mobility_rate': float(mob_rate)}
+             for n, mob_rate in grid(n_min, n_max, n_stepsize, mob_rate_min, mob_rate_max, mob_rate_stepsize)]
+    print("Run params: " + str(run_args))
+
+    results = []
+    for agent_class in agent_classes:
+        model_args = {'AgentClass': agent_class, 'number_of_agents': N, **AGENT_ARGS[agent_class]}
+        print("Model params: " + str(model_args))
+
+        if args.exact:
+            df = same_results(model_args, run_args, cells, args.reference, args.alternative,
+                              args.seed or 0)
+        else:
+            df = compare_engines(model_args, run_args, cells, args.replicates, args.reference,
+                                 args.alternative, args.alpha / len(agent_classes),
+                                 args.workers, args.seed)
+        df.insert(0, 'agent_class', agent_class)
+        results.append(df)
+
+        failed = df[~df['passed']]
+        if args.exact:
+            print(f"{agent_class}: {len(df) - len(failed)}/{len(df)} identical")
+        else:
+            print(f"{agent_class}: {len(df) - len(failed)}/{len(df)} passed, speedup {df['speedup'].min():.1f}x-{df['speedup'].max():.1f}x (timed serially, first seed of every cell)")
+        if len(failed) > 0:
+            print(failed.to_string(index=False))
+
+    df = pd.concat(results, ignore_index=True)
+    df.to_csv(str(args.output) + ".csv", index=False)
+    sys.exit(0 if df['passed'].all() else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1 @@
-python -m cProfile -o ./profiling/run_py.profile -s cumtime ./run.py
-Write-Output 'sort cumtime
-stats'|
-python -m pstats .\profiling\run_py.profile > profiling/run_py_stats_dump.txt
\ No newline at end of file
+python ./run.py --profile --profile-stacks --save-filename run_py.csv
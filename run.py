@@ -1,27 +1,104 @@
 ''' This runfile starts the multi-agent system model.
     Also, prints the values of the model arguments.
     After the model has run, some statistics will be printed.
+    If multiple replicates are run, the statistics over the
+    replicates are printed instead. A run can be resumed from
+    a checkpoint saved during an earlier run. With --converge,
+    the run stops early once it has converged. With --timing,
+    the time spent in every phase of a step is printed. With
+    --profile, the run is profiled and the hottest functions
+    are printed.
 '''
+from contextlib import nullcontext
+
 from utils.parse_args import parse_args
+from trust.convergence import ConvergenceDetector
+from trust.engines import create_model
 from trust.model import PDTModel
+from trust.store import open_store
+from utils.profiling import RunProfiler
+from utils.replicates import run_replicates
 
 DATA_PATH = 'data/'
 
 
 def run():
-    model_args, run_args, file_name = parse_args(True)
+    model_args, run_args, options = parse_args(True)
+
+    profiler = RunProfiler(options['profile_stacks']) if options['profile'] else None
+    with profiler or nullcontext():
+        simulate(model_args, run_args, options)
+
+    if profiler is not None:
+        import pandas as pd
+
+        summary = profiler.summary(options['profile_top'])
+        df_p = pd.DataFrame(summary['by_tottime'])
+        print(f"Profiled {summary['wall_time']:.2f} s")
+        print(df_p[['function', 'ncalls', 'tottime', 'cumtime']].to_string(index=False))
+        for path in profiler.save(DATA_PATH + "p_" + options['save_filename'], options['profile_top']):
+            print("Saved profile to " + path)
+
+
+def simulate(model_args, run_args, options):
+    file_name = options['save_filename']
 
-    model = PDTModel(**model_args)
+    if options['replicates'] > 1:
+        # Replicates are not checkpointed, only their steps are passed on
+        df_r = run_replicates(options['replicates'], T_onset=run_args['T_onset'],
+                              T_record=run_args['T_record'], **model_args)
+        print(df_r)
+        df_r.to_csv(DATA_PATH + "r_" + file_name)
+        return
 
-    model.run_model(**run_args)
-    df_m = model.datacollector.get_model_vars_dataframe()
+    if options['resume'] is not None:
+        # The model parameters of the checkpoint are used, and the recorded steps in the
+        # store are kept up to the checkpoint
+        model = PDTModel.load_checkpoint(options['resume'])
+        resume_at = model.datacollector.flushed
+    else:
+        model = create_model(**model_args)
+        resume_at = None
+
+    if options['timing']:
+        model.enable_timing()
+
+    # The recorded steps are written to the store while running, if flush_every is set
+    m_store = open_store(DATA_PATH + "m_" + file_name, options['store_format'], resume_at)
+    model.datacollector.attach_store(m_store, options['flush_every'])
+
+    if options['resume'] is not None:
+        model.resume_model(run_args['checkpoint_path'], run_args['checkpoint_every'])
+    elif options['converge']:
+        convergence = ConvergenceDetector(window=options['window'], tolerance=options['tolerance'],
+                                          target_se=options['target_se'])
+        model.run_model(**run_args, convergence=convergence)
+    else:
+        model.run_model(**run_args)
+    model.datacollector.flush()
+    df_m = m_store.read()
+    m_store.close()
     df_a = model.datacollector.get_agent_props_dataframe()
 
     print(df_m.describe())
     print(df_a.describe())
 
-    df_m.to_csv(DATA_PATH + "m_" + file_name)
-    df_a.to_csv(DATA_PATH + "a_" + file_name)
+    a_store = open_store(DATA_PATH + "a_" + file_name, options['store_format'])
+    a_store.write(df_a)
+    a_store.close()
+
+    if model.convergence is not None:
+        import pandas as pd
+
+        # The steps at which the run was stopped are saved next to the recorded data
+        df_c = pd.DataFrame([model.convergence.summary(model)])
+        print(df_c)
+        df_c.to_csv(DATA_PATH + "c_" + file_name, index=False)
+
+    if model.timer is not None:
+        df_t = model.timer.get_dataframe()
+        print(df_t)
+        df_t.to_csv(DATA_PATH + "t_" + file_name)
 
 
 if __name__ == "__main__":
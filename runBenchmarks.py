@@ -0,0 +1,79 @@
+''' This runfile runs the benchmark suite of the multi-agent
+    system model. It times the construction of the model, the
+    phases of a step and the DataFrame exporters for every
+    engine, agent class and number of agents, and prints the
+    steps and agent steps per second. The results are written
+    to a .json file, and can be compared to the results of
+    an earlier run (e.g. of another commit) with --compare.
+    With --imports, the time of importing the model in a
+    fresh interpreter is benchmarked as well.
+'''
+
+import argparse
+import sys
+
+from trust.engines import ENGINES
+from utils.benchmark import (IMPORTS, compare_imports, compare_results, load_results, run_suite,
+                             save_results)
+
+
+AGENT_ARGS = {
+    'MSAgent': {},
+    'WHAgent': {},
+    'RLAgent': {'learning_rate': 0.02, 'social_learning_rate': 0.5, 'discount_factor': 0.8, 'relative_reward': True},
+    'GossipAgent': {'memory_size': 25},
+    'RLGossipAgent': {'learning_rate': 0.05, 'social_learning_rate': 0.5, 'discount_factor': 0.8, 'relative_reward': True, 'memory_size': 25},
+}
+
+NEIGHBOURHOOD_SIZE = 50
+
+
+def parse_benchmark_args():
+    parser = argparse.ArgumentParser(description='Runs the benchmark suite of the MAS for trust in exchange')
+    parser.add_argument('output', help='Writes to OUTPUT.json')
+    parser.add_argument('-a', '--agent-classes', nargs='+', default=list(AGENT_ARGS), choices=list(AGENT_ARGS))
+    parser.add_argument('-N', '--number-of-agents', nargs='+', default=[1000, 10000, 100000], type=int)
+    parser.add_argument('-e', '--engines', nargs='+', default=['agent'], choices=list(ENGINES))
+    parser.add_argument('--steps', default=10, type=int, help='Number of timed steps of every run')
+    parser.add_argument('--warmup', default=5, type=int, help='Number of steps before the timed steps')
+    parser.add_argument('--repeats', default=3, type=int,
+                        help='Number of runs of every benchmark, of which the fastest is kept')
+    parser.add_argument('-s', '--seed', default=0, type=int)
+    parser.add_argument('--imports', action='store_true',
+                        help='Also times the imports of ' + ', '.join(IMPORTS) + ' in fresh interpreters')
+    parser.add_argument('--imports-only', action='store_true',
+                        help='Only times the imports, without running the model')
+    parser.add_argument('--compare', default=None,
+                        help='Compares the results to those in the .json file COMPARE')
+    parser.add_argument('--threshold', default=0.1, type=float,
+                        help='Relative slowdown above which a time is a regression (default 0.1)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_benchmark_args()
+
+    configurations = [] if args.imports_only else [
+        {'AgentClass': agent_class, 'number_of_agents': N,
+         'neighbourhood_size': NEIGHBOURHOOD_SIZE, **AGENT_ARGS[agent_class]}
+        for N in args.number_of_agents for agent_class in args.agent_classes]
+    imports = IMPORTS if args.imports or args.imports_only else ()
+    suite = run_suite(configurations, args.engines, args.steps, args.warmup, args.repeats,
+                      args.seed, imports, verbose=True)
+    save_results(suite, str(args.output) + ".json")
+
+    if args.compare is not None:
+        baseline = load_results(args.compare)
+        regressions = 0
+        for results, compare in (('results', compare_results), ('imports', compare_imports)):
+            if not suite[results] or not baseline.get(results):
+                continue
+            df = compare(baseline, suite, args.threshold)
+            print(df.to_string(index=False))
+            regressions += int(df['regression'].sum())
+            print(f"{df['regression'].sum()} of {len(df)} times are more than {args.threshold:.0%} slower")
+        sys.exit(1 if regressions > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
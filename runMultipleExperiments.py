@@ -1,15 +1,19 @@
 ''' This runfile starts the multi-agent system model
     for different mobilities and neighborhood sizes.
-    The output will be two .out files. The first can 
+    The cells of the grid are run in parallel, distributed
+    over a pool of worker processes, each with its own seed.
+    With --warm-start, the onset is run once per neighborhood
+    size, at a single mobility rate, and shared by the
+    recordings of all mobilities.
+    The output will be two .out files. The first can
     be used to print the average agents values for different
-    mobilities and neighborhood sizes. The second can be 
+    mobilities and neighborhood sizes. The second can be
     used to plot the density of agents trusting strangers.
 '''
 
-import pandas as pd
-from trust.model import PDTModel
-import numpy as np
-import sys
+import argparse
+
+from utils.sweep import grid, run_sweep, run_warm_start
 
 
 N = 1000 #number of agents
@@ -19,63 +23,73 @@ n_stepsize = 10 #step size in which neighborhood size is changes
 mob_rate_min = 0 #minimum mobility rate
 mob_rate_max = 1 #maximum mobility rate
 mob_rate_stepsize = 0.1 #step size in which mobility is changed
+warm_mob_rate = (mob_rate_min + mob_rate_max) / 2 #mobility rate of a shared onset, the middle of the range
 
-
-if (len(sys.argv) == 1):
-    print("Please specify the name of Output file")
-    sys.exit()
-
-if (len(sys.argv) == 3 ):
-    if sys.argv[2] =='MSAgent':
-        print('MSAgent')
-        model_args = {'AgentClass': 'MSAgent', 'mobility_rate': 0.2, 'number_of_agents': 1000, 'neighbourhood_size': 30}
-    elif sys.argv[2] == 'WHAgent':
-        print('WHAgent')
-        model_args = {'AgentClass': 'WHAgent', 'mobility_rate': 0.2, 'number_of_agents': 1000, 'neighbourhood_size': 30}
-    elif (sys.argv[2] == "RLAgent"):
-        print("RLAgent")
-        model_args = {'AgentClass': 'RLAgent', 'mobility_rate': 0.2, 'number_of_agents': 1000, 'neighbourhood_size': 30, 'learning_rate': 0.02, 'social_learning_rate': 0.5, 'discount_factor': 0.8, 'relative_reward': True}  
-    elif (sys.argv[2] == "RLGossipAgent"):
-        print("RLGossipAgent")
-        model_args = {'AgentClass': 'RLGossipAgent', 'mobility_rate': 0.2, 'number_of_agents': 1000, 'neighbourhood_size': 30, 'learning_rate': 0.05, 'social_learning_rate': 0.5, 'discount_factor': 0.8, 'relative_reward': True, 'memory_size': 25}
-    else:
-        print("invalid agent type. choices are 'MSAgent', 'WHAgent', 'RLAgent' or 'GossipAgent'")
-        sys.exit()
-else:
-    print('MSAgent')
-    model_args = {'AgentClass': 'MSAgent', 'mobility_rate': 0.2, 'number_of_agents': 1000, 'neighbourhood_size': 30} 
+AGENT_ARGS = {
+    'MSAgent': {},
+    'WHAgent': {},
+    'RLAgent': {'learning_rate': 0.02, 'social_learning_rate': 0.5, 'discount_factor': 0.8, 'relative_reward': True},
+    'RLGossipAgent': {'learning_rate': 0.05, 'social_learning_rate': 0.5, 'discount_factor': 0.8, 'relative_reward': True, 'memory_size': 25},
+}
 
 #specify the number of epochs before and after strarting to record values
 run_args = {'T_onset': 100, 'T_record': 100}
 
-print("Model params: " + str(model_args))
-print("Run params: " + str(run_args))
 
+def parse_sweep_args():
+    parser = argparse.ArgumentParser(description='Runs the MAS for trust in exchange for different mobilities and neighborhood sizes')
+    parser.add_argument('output', help='Writes to OUTPUT.out and OUTPUTTrustDensity.out')
+    parser.add_argument('agent_class', nargs='?', default='MSAgent', choices=list(AGENT_ARGS))
+    parser.add_argument('-w', '--workers', default=None, type=int,
+                        help='Number of worker processes (default: number of cores)')
+    parser.add_argument('-s', '--seed', default=None, type=int,
+                        help='Seed from which the seed of every cell is derived')
+    parser.add_argument('-e', '--engine', default='agent', choices=['agent', 'vectorized', 'compiled'])
+    parser.add_argument('--warm-start', action='store_true',
+                        help='Shares the onset of a neighborhood size between all mobilities')
+    parser.add_argument('--warm-mobility', default=warm_mob_rate, type=float,
+                        help='Mobility rate of the shared onsets (default: the middle of the mobility range, %(default)s)')
+    return parser.parse_args()
+
+
+def warm_start_sweep(model_args, cells, warm_mob_rate, workers, seed):
+    # The cells of a neighborhood size are consecutive, so the branches are yielded in the order of the cells
+    neighborhood_sizes = list(dict.fromkeys(n for n, _ in cells))
+    onsets = [({**model_args, 'neighbourhood_size': n, 'mobility_rate': warm_mob_rate},
+               [{'mobility_rate': mob_rate} for cell_n, mob_rate in cells if cell_n == n])
+              for n in neighborhood_sizes]
+    return run_warm_start(onsets, run_args['T_onset'], run_args['T_record'], workers=workers, seed=seed)
+
+
+def main():
+    args = parse_sweep_args()
 
-with open(str(sys.argv[1]) + ".out", 'w') as f:
-    with open(str(sys.argv[1]) + "TrustDensity.out", 'w') as g:
-        f.write(str(n_min) +" " + str(n_max) +" " + str(n_stepsize) +" " + str(mob_rate_min) +" " + str(mob_rate_max) + " " +str(mob_rate_stepsize) + "\n")
-        g.write(str(n_min) +" " + str(n_max) +" " + str(n_stepsize) +" " + str(mob_rate_min) +" " + str(mob_rate_max) + " " +str(mob_rate_stepsize) + "\n")
+    print(args.agent_class)
+    model_args = {'AgentClass': args.agent_class, 'engine': args.engine, 'number_of_agents': N, **AGENT_ARGS[args.agent_class]}
 
-        print("Number of agents: " + str(N))
-        for n in np.arange(n_min,n_max + 0.001,n_stepsize):
-            for mob_rate in np.arange(mob_rate_min,mob_rate_max + 0.0001,mob_rate_stepsize):
+    print("Model params: " + str(model_args))
+    print("Run params: " + str(run_args))
+
+    cells = grid(n_min, n_max, n_stepsize, mob_rate_min, mob_rate_max, mob_rate_stepsize)
+    if args.warm_start:
+        results = warm_start_sweep(model_args, cells, args.warm_mobility, args.workers, args.seed)
+    else:
+        results = run_sweep(model_args, run_args, cells, workers=args.workers, seed=args.seed)
+
+    with open(str(args.output) + ".out", 'w') as f:
+        with open(str(args.output) + "TrustDensity.out", 'w') as g:
+            f.write(str(n_min) +" " + str(n_max) +" " + str(n_stepsize) +" " + str(mob_rate_min) +" " + str(mob_rate_max) + " " +str(mob_rate_stepsize) + "\n")
+            g.write(str(n_min) +" " + str(n_max) +" " + str(n_stepsize) +" " + str(mob_rate_min) +" " + str(mob_rate_max) + " " +str(mob_rate_stepsize) + "\n")
+
+            print("Number of agents: " + str(N))
+            for (n, mob_rate), (means, trust_proportions) in zip(cells, results):
                 print("Neighborhood size: " + str(n) + ", Mobility rate: " + str(mob_rate))
 
-                model_args["mobility_rate"] = mob_rate
-                model_args["neighbourhood_size"] = n
-                model = PDTModel(**model_args)
-                model.run_model(**run_args)
-                df_m = model.datacollector.get_model_vars_dataframe()
-                df_a = model.datacollector.get_agent_props_dataframe()
-
-                f.write(str(df_m["Market_Size"].mean()) + " ")
-                f.write(str(df_m["Trust_in_Strangers"].mean()) + " ")
-                f.write(str(df_m["Signal_Reading"].mean()) + " ")
-                f.write(str(df_m["Trust_Rate"].mean()) + " ")
-                f.write(str(df_m["Cooperating_Agents"].mean()) + " ")
-                f.write(str(df_m["Trust_in_Neighbors"].mean()) + " ")
-                f.write(str(df_m["Trust_in_Newcomers"].mean()) + "\n")
-                for value in df_a["Trust_in_Stranger_proportion"]:
+                f.write(" ".join(str(mean) for mean in means) + "\n")
+                for value in trust_proportions:
                     g.write(str(value) + " ")
-                g.write("\n")
\ No newline at end of file
+                g.write("\n")
+
+
+if __name__ == "__main__":
+    main()
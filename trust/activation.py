@@ -1,17 +1,27 @@
 """ This file defines the scheduler used for the model.
 """
+import time
 from typing import TYPE_CHECKING, Iterator, List
 
 from mesa.time import BaseScheduler
 
 if TYPE_CHECKING:
     from trust.agent import BaseAgent
+    from trust.timing import PhaseTimer
 
 
 class TwoStepActivation(BaseScheduler):
     """ This class represents the scheduler created for the model.
     """
 
+    def add_agents(self, agents: List['BaseAgent']) -> None:
+        """ Adds the agents to the schedule at once, in the passed order.
+        """
+        added = {agent.unique_id: agent for agent in agents}
+        if len(added) < len(agents) or not self._agents.keys().isdisjoint(added):
+            raise Exception("Agents with the same unique id added to scheduler")
+        self._agents.update(added)
+
     def step(self) -> None:
         """ Executes the step method of all agents, one at a time.
         """
@@ -20,11 +30,38 @@ class TwoStepActivation(BaseScheduler):
         self.time += .5
 
     def finalize(self) -> None:
-        """ Executes the finalize method of all agents, one at a time.
-            After completing all finalize methods, it moves to the next step.
+        """ Executes the finalize method of all agents, one at a time. If the model has a
+            learner (see trust.learning), the propensities of the paired agents are updated
+            by the learner at once beforehand. After completing all finalize methods, it moves
+            to the next step.
+
+            If the model is timed, the learner and the agents are timed separately.
         """
+        timer = self.model.timer
+        if timer is not None:
+            return self._timed_finalize(timer)
+
+        learner = self.model.learner
+        if learner is not None:
+            learner.update(self.agents)
+        for agent in self.agent_buffer(shuffled=False):
+            agent.finalize()
+        self.time += .5
+        self.steps += 1
+
+    def _timed_finalize(self, timer: 'PhaseTimer') -> None:
+        """ Executes finalize, timing the learner and the agents separately.
+        """
+        learner = self.model.learner
+        if learner is not None:
+            start = time.perf_counter()
+            learner.update(self.agents)
+            timer.add('schedule.finalize.learner', time.perf_counter() - start)
+
+        start = time.perf_counter()
         for agent in self.agent_buffer(shuffled=False):
             agent.finalize()
+        timer.add('schedule.finalize.agents', time.perf_counter() - start)
         self.time += .5
         self.steps += 1
 
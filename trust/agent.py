@@ -3,9 +3,9 @@
 from typing import TYPE_CHECKING
 
 from mesa import Agent
-from utils.dictionary import LimitedDict
 
 from trust.choice import PDTChoice
+from trust.gossip import GossipStore
 
 if TYPE_CHECKING:
     from trust.model import PDTModel
@@ -13,7 +13,15 @@ if TYPE_CHECKING:
 
 class BaseAgent(Agent):
     """ Defines a base agent, which is an implementation of an Agent as defined by the MESA module.
+
+        The attributes of the agents are declared as slots, which makes the agents smaller and
+        their attributes faster to access. Subclasses declare the slots of the attributes
+        they add.
     """
+    __slots__ = ('unique_id', 'model', 'pos', 'rng', 'neighbourhood', 'newcomer', 'trust_prob',
+                 'trustworthiness_prob', 'location_prob', 'social_learning_rate', 'play',
+                 'pdtchoice', 'in_market', 'paired', 'exchange_partner', 'partner_is_stranger',
+                 'partner_is_newcomer', 'payoff', 'cumulative_payoff')
     def __init__(self, unique_id: int, model: 'PDTModel', neighbourhood: int) -> None:
         """ Initializes the baseAgent. Saves the neighbourhood that the agent is in, and does not
             mark it as a newcomer. Initializes the propensity to read signals (antagonist
@@ -26,16 +34,18 @@ class BaseAgent(Agent):
         """
         super().__init__(unique_id, model)
         self.model: 'PDTModel'
+        # The random number stream shared by all agents, instead of the generator of the MESA Agent
+        self.rng = model.rng
 
         self.neighbourhood = neighbourhood
         self.newcomer = False
 
         # Equivalent to the propensity to play or read signals
-        self.trust_prob = self.random.random()
+        self.trust_prob = self.rng.random()
         # Propensity to cooperate (over defect)
-        self.trustworthiness_prob = self.random.random()
+        self.trustworthiness_prob = self.rng.random()
         # Propensity to enter the open market
-        self.location_prob = self.random.random()
+        self.location_prob = self.rng.random()
 
         self.social_learning_rate = 0.5
 
@@ -56,22 +66,27 @@ class BaseAgent(Agent):
             probability) wether to stay in the neighbourhood or move to the global market
             for its next interaction.
         """
-        if self.random.random() < self.model.mobility_rate:
+        if self.rng.random() < self.model.mobility_rate:
             self.move()
         else:
             self.stay()
 
-        if self.random.random() < self.location_prob:
+        if self.rng.random() < self.location_prob:
             self.enter_market()
 
     def finalize(self) -> None:
         """ If the agent is paired with another agent, it will update its behaviour (i.e. its
             decision to play/exit and to cooperate/defect in the prisoners' dilemma).
             Afterwards, the variable paired is reset to False and the agent will leave the
-            global market (if it was there).
+            global market (if it was there). The change in the propensity to trust is added
+            to the sum over all agents kept by the model.
+
+            If the model has a learner, the behaviour has already been updated by the learner.
         """
-        if self.paired:
+        if self.paired and self.model.learner is None:
+            trust_prob = self.trust_prob
             self.update_behaviour()
+            self.model.trust_prob_sum += self.trust_prob - trust_prob
         self.paired = False
         self.leave_market()
 
@@ -82,7 +97,7 @@ class BaseAgent(Agent):
             As this function is equal for all types of agent, this remains uniform across the
             conditions of being in the neighbourhood versus the global market.
         """
-        if self.random.random() < self.trustworthiness_prob:
+        if self.rng.random() < self.trustworthiness_prob:
             self.pdtchoice = PDTChoice.COOPERATE
         else:
             self.pdtchoice = PDTChoice.DEFECT
@@ -111,7 +126,7 @@ class BaseAgent(Agent):
         """ Moves an agent to a different neighbourhood than it is in now, also marks
             the agent as a newcomer and resets its cumulative payoff.
         """
-        new_nbh = self.random.randint(0, self.model.num_neighbourhoods - 1)
+        new_nbh = self.rng.randint(0, self.model.num_neighbourhoods - 1)
         if new_nbh >= self.neighbourhood:
             new_nbh = (new_nbh + 1) % (self.model.num_neighbourhoods - 1)
         self.model.network.add_agent_to_neighbourhood(self, new_nbh)
@@ -158,7 +173,7 @@ class BaseAgent(Agent):
         role_model = self.model.network.get_role_model(self.neighbourhood)
         social_learning = role_model is not None and role_model is not self
 
-        if social_learning and self.random.random() < self.social_learning_rate:
+        if social_learning and self.rng.random() < self.social_learning_rate:
             prob = getattr(role_model, action_prob_attr)
         elif not action_test:
             prob = 1 - \
@@ -204,6 +219,7 @@ class MSAgent(BaseAgent):
         the prisoners' dilemma with the agent he is matched with is based on the propensity
         to read signals.
     """
+    __slots__ = ()
 
     def decide_play(self, exchange_partner: 'MSAgent') -> None:
         """ Updates the agents decision to play or exit a prisoners' dilemma.
@@ -214,7 +230,7 @@ class MSAgent(BaseAgent):
         """
         super().decide_play(exchange_partner)
 
-        if self.random.random() < self.trust_prob:
+        if self.rng.random() < self.trust_prob:
             self.play = True
         else:
             self.play = False
@@ -227,6 +243,7 @@ class WHAgent(BaseAgent):
         the prisoners' dilemma with the agent he is matched with is different for known agents
         and stangers.
     """
+    __slots__ = ('read_signal',)
 
     def __init__(self, unique_id: int, model: 'PDTModel', neighbourhood: int) -> None:
         """ Initializes the WHAgent. In addition to the initialization done for the BaseAgent,
@@ -252,7 +269,7 @@ class WHAgent(BaseAgent):
         """
         super().decide_play(exchange_partner)
 
-        if self.random.random() < self.trust_prob:
+        if self.rng.random() < self.trust_prob:
             self.signal_reading()
         else:
             self.parochialism()
@@ -295,7 +312,7 @@ class WHAgent(BaseAgent):
             The signal correctness is linearly interpolated between those values.
         """
         signal_correctness = 0.5 + abs(self.trustworthiness_prob - 0.5)
-        if self.random.random() < signal_correctness:
+        if self.rng.random() < signal_correctness:
             return self.pdtchoice
 
         # Returns opposite signal of the PDT choice
@@ -323,6 +340,7 @@ class RLAgent(WHAgent):
         Similar to the WHAgent, though the learning rate is no longer stochastic
         but based on a new implementation of reinforcement learning.
     """
+    __slots__ = ('n_payoffs', 'discount_factor', 'learning_rate', 'relative_reward')
 
     def __init__(self, unique_id: int, model: 'PDTModel', neighbourhood: int,
                  learning_rate: float, discount_factor: float = 0.9,
@@ -375,11 +393,22 @@ class BaseGossipAgent(WHAgent):
         advice from the role model to decide whether or not to cooperate in the
         prisoners' dilemma.
     """
+    __slots__ = ()
+
+    def __init__(self, model: 'PDTModel', memory_size: int) -> None:
+        """ Initializes the BaseGossipAgent. The memories of all agents are kept in the gossip
+            store of the model (see trust.gossip), which is created by the first agent with
+            room for memory_size partners per agent.
+        """
+        if model.gossip is None:
+            model.gossip = GossipStore(model.num_agents, memory_size)
 
-    def __init__(self, memory_size: int) -> None:
-        """ Initializes the BaseGossipAgent
+    @property
+    def memories(self) -> 'dict[int, bool]':
+        """ Returns the memories of the agent, from the id of a partner to whether the
+            encounter with the partner was positive.
         """
-        self.memories: LimitedDict[int, bool] = LimitedDict(memory_size)
+        return self.model.gossip.memories(self.unique_id)
 
     def finalize(self) -> None:
         """ Finalize step of the BaseGossipAgent. Memorizes the outcome of
@@ -407,15 +436,16 @@ class BaseGossipAgent(WHAgent):
             self.neighbourhood)
 
         partner_id = self.exchange_partner.unique_id
+        gossip = self.model.gossip
 
-        if partner_id in self.memories:
-            memory = self.memories[partner_id]
+        memory = gossip.get(self.unique_id, partner_id)
+        if memory is None:
+            # The advice of the role model
+            memory = gossip.get(role_model.unique_id, partner_id)
+        if memory is not None:
             self.play = memory
-        elif partner_id in role_model.memories:
-            advice = role_model.memories[partner_id]
-            self.play = advice
         else:
-            if self.random.random() < self.trust_prob:
+            if self.rng.random() < self.trust_prob:
                 self.signal_reading()
             else:
                 self.parochialism()
@@ -424,29 +454,31 @@ class BaseGossipAgent(WHAgent):
         """ Memorizes the encounter with the opponent, save wehter or not
             this was a positive encounter.
         """
-        if self.payoff > 0:
-            self.memories[self.exchange_partner.unique_id] = True
-        else:
-            self.memories[self.exchange_partner.unique_id] = False
+        self.model.gossip.memorize(self.unique_id, self.exchange_partner.unique_id,
+                                   self.payoff > 0)
 
 
 class GossipAgent(BaseGossipAgent):
     """ Implementation of the GossipAgent, extends the BaseGossipAgent and WHAgent.
     """
+    __slots__ = ()
+
     def __init__(self, unique_id: int, model: 'PDTModel', neighbourhood: int,
                  memory_size: int) -> None:
         """ Initializes the GossipAgent.
         """
-        super().__init__(memory_size)
-        super(WHAgent, self).__init__(unique_id, model, neighbourhood)
+        super().__init__(model, memory_size)
+        WHAgent.__init__(self, unique_id, model, neighbourhood)
 
 
 class RLGossipAgent(BaseGossipAgent, RLAgent):
     """ Implementation of the RLGossipAgent, extends the BaseGossipAgent and RLAgent.
     """
+    __slots__ = ()
+
     def __init__(self, unique_id: int, model: 'PDTModel', neighbourhood: int, **kwargs) -> None:
         """ Initializes the RLGossipAgent.
         """
         memory_size = kwargs.pop('memory_size')
-        super().__init__(memory_size)
+        super().__init__(model, memory_size)
         RLAgent.__init__(self, unique_id, model, neighbourhood, **kwargs)
@@ -0,0 +1,343 @@
+""" This file contains the compiled engine of the PDTModel. It keeps the array state of the
+    vectorized engine, but runs every phase of a step as a loop over the agents and pairs,
+    which Numba compiles to machine code. Numba is optional: it is only imported when a
+    compiled model is created, and without it the vectorized engine is run instead. The
+    gossiping agents have no kernels, so they are always run by the vectorized engine.
+"""
+import warnings
+from types import SimpleNamespace
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+
+import trust.agent as agent_module
+from trust.agent import MSAgent, RLAgent, WHAgent
+from trust.vectorized import ArrayNetwork, Population, VectorizedPDTModel
+
+# The names of the kernels below, which are compiled together
+KERNEL_NAMES = ('move_and_enter', 'set_role_models', 'pair', 'play_pdt', 'update_behaviour')
+
+# The kernels compiled by Numba, or None if Numba is not installed. Loaded on first use.
+_compiled_kernels: SimpleNamespace = None
+
+
+def move_and_enter(neighbourhood: np.ndarray, newcomer: np.ndarray, in_market: np.ndarray,
+                   location_prob: np.ndarray, moving_draws: np.ndarray,
+                   new_neighbourhoods: np.ndarray, market_draws: np.ndarray,
+                   mobility_rate: float, num_neighbourhoods: int) -> None:
+    """ Moves the agents of which the draw is below the mobility rate to the next of the new
+        neighbourhoods, and lets the agents of which the draw is below their location
+        probability enter the market. See Population.step.
+    """
+    moved = 0
+    for i in range(len(neighbourhood)):
+        newcomer[i] = moving_draws[i] < mobility_rate
+        if newcomer[i]:
+            new_nbh = new_neighbourhoods[moved]
+            moved += 1
+            if new_nbh >= neighbourhood[i]:
+                new_nbh = (new_nbh + 1) % (num_neighbourhoods - 1)
+            neighbourhood[i] = new_nbh
+        in_market[i] = market_draws[i] < location_prob[i]
+
+
+def set_role_models(role_models: np.ndarray, neighbourhood: np.ndarray,
+                    cumulative_payoff: np.ndarray) -> None:
+    """ Updates the role model of every non-empty neighbourhood to its agent with the highest
+        cumulative payoff, the agent with the lowest id on a tie. See
+        ArrayNetwork.set_role_models.
+    """
+    best = np.full(len(role_models), -1)
+    for i in range(len(neighbourhood)):
+        nbh = neighbourhood[i]
+        if best[nbh] < 0 or cumulative_payoff[i] > cumulative_payoff[best[nbh]]:
+            best[nbh] = i
+    for nbh in range(len(role_models)):
+        if best[nbh] >= 0:
+            role_models[nbh] = best[nbh]
+
+
+def pair(group: np.ndarray, keys: np.ndarray,
+         num_groups: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Pairs the agents of every group (a neighbourhood or the market) in the order of their
+        keys, and returns the first and second agent of every pair and the size of every
+        group. See ArrayNetwork.pair_and_play.
+    """
+    sizes = np.zeros(num_groups, dtype=np.int64)
+    for i in range(len(group)):
+        sizes[group[i]] += 1
+    starts = np.cumsum(sizes) - sizes
+
+    # Sorted by group, and within a group by key
+    positions = starts.copy()
+    ordered = np.empty(len(group), dtype=np.int64)
+    for i in np.argsort(keys):
+        ordered[positions[group[i]]] = i
+        positions[group[i]] += 1
+
+    num_pairs = 0
+    for g in range(num_groups):
+        num_pairs += sizes[g] // 2
+    agents_a = np.empty(num_pairs, dtype=np.int64)
+    agents_b = np.empty(num_pairs, dtype=np.int64)
+    p = 0
+    for g in range(num_groups):
+        for k in range(sizes[g] // 2):
+            agents_a[p] = ordered[starts[g] + 2 * k]
+            agents_b[p] = ordered[starts[g] + 2 * k + 1]
+            p += 1
+    return agents_a, agents_b, sizes
+
+
+def play_pdt(agents_a: np.ndarray, agents_b: np.ndarray, opportunity_cost: np.ndarray,
+             draws: np.ndarray, payoff_matrix: np.ndarray, exit_payoff: float,
+             reads_signals: bool, reinforcement: bool, discount_factor: float,
+             newcomer: np.ndarray, in_market: np.ndarray, trust_prob: np.ndarray,
+             trustworthiness_prob: np.ndarray, cooperate: np.ndarray, play: np.ndarray,
+             read_signal: np.ndarray, paired: np.ndarray, exchange_partner: np.ndarray,
+             partner_is_stranger: np.ndarray, partner_is_newcomer: np.ndarray,
+             payoff: np.ndarray, cumulative_payoff: np.ndarray, n_payoffs: np.ndarray) -> None:
+    """ Lets all pairs of agents play the prisoners' dilemma, as ArrayNetwork.play_PDT. The
+        rows of draws are the uniform numbers of the pairs, in the order in which the
+        vectorized engine draws them: the cooperation of the first and second agents, and
+        per side the trust (and for agents reading signals the signal correctness).
+    """
+    for p in range(len(agents_a)):
+        cooperate[agents_a[p]] = draws[0, p] < trustworthiness_prob[agents_a[p]]
+        cooperate[agents_b[p]] = draws[1, p] < trustworthiness_prob[agents_b[p]]
+
+    side_draws = 2 if reads_signals else 1
+    for side in range(2):
+        agents, partners = (agents_a, agents_b) if side == 0 else (agents_b, agents_a)
+        row = 2 + side * side_draws
+        for p in range(len(agents)):
+            i = agents[p]
+            j = partners[p]
+            paired[i] = True
+            exchange_partner[i] = j
+
+            newcomer_pair = newcomer[j] or newcomer[i]
+            stranger = newcomer_pair or in_market[i]
+            partner_is_newcomer[i] = newcomer_pair and not in_market[i]
+            partner_is_stranger[i] = stranger
+
+            trusting = draws[row, p] < trust_prob[i]
+            if reads_signals:
+                correct = draws[row + 1, p] < 0.5 + abs(trustworthiness_prob[j] - 0.5)
+                play[i] = (cooperate[j] == correct) if trusting else not stranger
+                read_signal[i] = trusting
+            else:
+                play[i] = trusting
+
+    for side in range(2):
+        agents, partners = (agents_a, agents_b) if side == 0 else (agents_b, agents_a)
+        for p in range(len(agents)):
+            i = agents[p]
+            j = partners[p]
+            if play[i] and play[j]:
+                value = payoff_matrix[int(cooperate[i]), int(cooperate[j])] \
+                    - 0.5 * opportunity_cost[p] * int(cooperate[j])
+            else:
+                value = exit_payoff
+            payoff[i] = value
+            if reinforcement:
+                cumulative_payoff[i] = value + discount_factor * cumulative_payoff[i]
+                n_payoffs[i] = 1 + discount_factor * n_payoffs[i]
+            else:
+                cumulative_payoff[i] += value
+
+
+def update_behaviour(draws: np.ndarray, role_models: np.ndarray, social_learning_rate: float,
+                     learning_rate: float, relative_reward: bool, reads_signals: bool,
+                     neighbourhood: np.ndarray, paired: np.ndarray, in_market: np.ndarray,
+                     cooperate: np.ndarray, play: np.ndarray, read_signal: np.ndarray,
+                     payoff: np.ndarray, cumulative_payoff: np.ndarray, n_payoffs: np.ndarray,
+                     location_prob: np.ndarray, trustworthiness_prob: np.ndarray,
+                     trust_prob: np.ndarray) -> None:
+    """ Updates the propensities of all paired agents, as Population.update_behaviour. Row k
+        of draws holds the uniform numbers of the paired agents for the social learning of
+        the k-th propensity. Stochastic learning is reinforcement learning with a learning
+        rate of 1 and no relative reward.
+
+        The agents are updated in place in the order of their id, so an agent copies the
+        already updated propensity of a role model with a lower id.
+    """
+    for k in range(3):
+        prob = location_prob if k == 0 else trustworthiness_prob if k == 1 else trust_prob
+        n = 0
+        for i in range(len(paired)):
+            if not paired[i]:
+                continue
+            if k == 0:
+                action = in_market[i]
+            elif k == 1:
+                action = not cooperate[i] if reads_signals else cooperate[i]
+            else:
+                action = read_signal[i] if reads_signals else play[i]
+
+            reward = payoff[i]
+            if relative_reward and n_payoffs[i] > 0:
+                reward = reward - cumulative_payoff[i] / n_payoffs[i]
+            value = prob[i] if action else 1 - prob[i]
+            if reward >= 0:
+                value = value + learning_rate * (1 - value) * reward
+            else:
+                value = value + learning_rate * value * reward
+            learned = value if action else 1 - value
+
+            role_model = role_models[neighbourhood[i]]
+            if role_model >= 0 and role_model != i and draws[k, n] < social_learning_rate:
+                prob[i] = prob[role_model]
+            else:
+                prob[i] = learned
+            n += 1
+
+
+def get_kernels(compiled: bool = True) -> SimpleNamespace:
+    """ Returns the kernels, compiled by Numba if compiled is set, or as plain Python functions
+        otherwise. Returns None if the kernels should be compiled but Numba is not installed.
+    """
+    global _compiled_kernels
+    module = globals()
+    if not compiled:
+        return SimpleNamespace(**{name: module[name] for name in KERNEL_NAMES})
+    if _compiled_kernels is None:
+        try:
+            import numba
+        except ImportError:
+            return None
+        _compiled_kernels = SimpleNamespace(**{name: numba.njit(cache=True)(module[name])
+                                               for name in KERNEL_NAMES})
+    return _compiled_kernels
+
+
+class CompiledPopulation(Population):
+    """ Defines the Population of the compiled engine, of which the step and finalize phase
+        are run by the kernels. The random numbers are drawn beforehand from the generator of
+        the model, in the same order as by the Population, so both give the same results.
+    """
+    def __init__(self, model: 'CompiledPDTModel', AgentClass: type, **kwargs) -> None:
+        """ Initializes the Population. Agents that do not learn by reinforcement learning have
+            no number of payoffs, but the kernels expect an array.
+        """
+        super().__init__(model, AgentClass, **kwargs)
+        if not self.reinforcement:
+            self.n_payoffs = np.zeros(0)
+
+    def step(self) -> None:
+        """ Moves agents to a new neighbourhood and lets every agent choose whether to enter
+            the global market. See Population.step.
+        """
+        kernels = self.model.kernels
+        if kernels is None:
+            return super().step()
+
+        moving_draws = self.rng.random(self.num_agents)
+        new_neighbourhoods = self.rng.integers(
+            0, self.model.num_neighbourhoods,
+            np.count_nonzero(moving_draws < self.model.mobility_rate))
+        market_draws = self.rng.random(self.num_agents)
+        kernels.move_and_enter(self.neighbourhood, self.newcomer, self.in_market,
+                               self.location_prob, moving_draws, new_neighbourhoods,
+                               market_draws, self.model.mobility_rate,
+                               self.model.num_neighbourhoods)
+        self.time += .5
+
+    def finalize(self) -> None:
+        """ Updates the behaviour of all paired agents, after which all agents are unpaired
+            and leave the global market. See Population.finalize.
+        """
+        kernels = self.model.kernels
+        if kernels is None:
+            return super().finalize()
+
+        draws = self.rng.random((3, np.count_nonzero(self.paired)))
+        learning_rate = self.learning_rate if self.reinforcement else 1.
+        relative_reward = self.reinforcement and self.relative_reward
+        kernels.update_behaviour(
+            draws, self.model.network.role_models, self.social_learning_rate, learning_rate,
+            relative_reward, self.reads_signals, self.neighbourhood, self.paired,
+            self.in_market, self.cooperate, self.play, self.read_signal, self.payoff,
+            self.cumulative_payoff, self.n_payoffs, self.location_prob,
+            self.trustworthiness_prob, self.trust_prob)
+        self.paired[:] = False
+        self.in_market[:] = False
+        self.time += .5
+        self.steps += 1
+
+
+class CompiledNetwork(ArrayNetwork):
+    """ Defines the ArrayNetwork of the compiled engine, which pairs the agents and lets them
+        play by the kernels.
+    """
+    def pair_and_play(self) -> None:
+        """ Updates the role models, pairs all agents in their neighbourhood or the global
+            market and lets all pairs play the prisoners' dilemma. See
+            ArrayNetwork.pair_and_play.
+        """
+        kernels = self.model.kernels
+        if kernels is None:
+            return super().pair_and_play()
+
+        population = self.population
+        rng = self.model.rng.generator
+        kernels.set_role_models(self.role_models, population.neighbourhood,
+                                population.cumulative_payoff)
+
+        group = np.where(population.in_market, self.num_neighbourhoods,
+                         population.neighbourhood)
+        agents_a, agents_b, sizes = kernels.pair(group, rng.random(len(group)),
+                                                 self.num_neighbourhoods + 1)
+        opportunity_cost = self.model.get_opportunity_cost(sizes[group[agents_a]])
+
+        draws = rng.random((6 if population.reads_signals else 4, len(agents_a)))
+        discount_factor = population.discount_factor if population.reinforcement else 1.
+        kernels.play_pdt(
+            agents_a, agents_b, opportunity_cost, draws, self.payoff_matrix,
+            self.model.exit_payoff, population.reads_signals, population.reinforcement,
+            discount_factor, population.newcomer, population.in_market,
+            population.trust_prob, population.trustworthiness_prob, population.cooperate,
+            population.play, population.read_signal, population.paired,
+            population.exchange_partner, population.partner_is_stranger,
+            population.partner_is_newcomer, population.payoff, population.cumulative_payoff,
+            population.n_payoffs)
+
+
+class CompiledPDTModel(VectorizedPDTModel):
+    """ Defines the PDTModel with the compiled engine. Gives the same results as the
+        vectorized engine with the same seed, as the kernels use the same random numbers. If
+        Numba is not installed, or the agent class has no kernels (the gossiping agents), the
+        vectorized engine is run instead.
+    """
+    ENGINE = 'compiled'
+    # The agent classes run by the kernels
+    COMPILED_AGENTS = (MSAgent, WHAgent, RLAgent)
+    PopulationClass = CompiledPopulation
+    NetworkClass = CompiledNetwork
+
+    def __init__(self, AgentClass: Union[str, type] = MSAgent, number_of_agents: int = 1000,
+                 neighbourhood_size: int = 50, mobility_rate: float = 0.2, seed: int = None,
+                 neighbourhood_sizes: Union[str, Sequence[int]] = 'equal',
+                 size_variation: float = 0.5, compiled: bool = True, **kwargs) -> None:
+        """ Initializes the model with the same parameters as the VectorizedPDTModel. compiled
+            is whether the kernels are compiled by Numba (default True). Without compiling,
+            the kernels run as plain Python, which is slow but shows their results without
+            Numba.
+        """
+        if isinstance(AgentClass, str):
+            AgentClass = getattr(agent_module, AgentClass)
+        self.compiled = compiled
+        self.has_kernels = AgentClass in self.COMPILED_AGENTS
+        if self.has_kernels and self.kernels is None:
+            warnings.warn('Numba is not installed, the vectorized engine is run instead')
+        super().__init__(AgentClass, number_of_agents, neighbourhood_size, mobility_rate, seed,
+                         neighbourhood_sizes, size_variation, **kwargs)
+
+    @property
+    def kernels(self) -> SimpleNamespace:
+        """ Returns the kernels of the model, or None if its agent class has no kernels or
+            they cannot be compiled.
+        """
+        if not self.has_kernels:
+            return None
+        return get_kernels(self.compiled)
@@ -0,0 +1,124 @@
+""" This file contains the convergence detector, with which a run of the model ends its onset
+    once the model is stationary and ends its recording once the estimates of the recorded
+    values are precise enough.
+"""
+from typing import TYPE_CHECKING, Dict, Sequence
+
+import numpy as np
+
+from trust.datacollector import ColumnBuffer
+
+if TYPE_CHECKING:
+    from trust.model import PDTModel
+
+
+class ConvergenceDetector:
+    """ Defines a convergence detector on a selection of the model reporters. The onset is
+        considered stationary once, for every reporter, the means of the last two windows of
+        steps differ by at most the tolerance. The recording is considered precise once the
+        standard error of the mean of every reporter, estimated by the method of batch means,
+        is at most the target standard error.
+
+        The tests are only done at the end of every window, so they add little to a step.
+    """
+    def __init__(self, reporters: Sequence[str] = ('Market_Size', 'Signal_Reading'),
+                 window: int = 100, tolerance: float = 0.01, target_se: float = None,
+                 batches: int = 20) -> None:
+        """ Initializes the detector for the passed model reporters. window is the number of
+            steps over which the onset means are taken and after which the tests are repeated,
+            tolerance the largest difference between the means of two windows to be
+            stationary, target_se the standard error at which the recording is stopped
+            (default None, to record all steps) and batches the number of batch means.
+        """
+        if window < 1:
+            raise ValueError(f'window={window} should be at least 1')
+        if batches < 2:
+            raise ValueError(f'batches={batches} should be at least 2')
+
+        self.reporters = list(reporters)
+        self.window = window
+        self.tolerance = tolerance
+        self.target_se = target_se
+        self.batches = batches
+
+        self._onset_values = ColumnBuffer((len(self.reporters),), capacity=2 * window)
+        self._record_values = ColumnBuffer((len(self.reporters),))
+
+        # The steps after which the onset and recording were stopped, None if not (yet) stopped
+        self.onset_stopped_at: int = None
+        self.record_stopped_at: int = None
+
+    def observe(self, model: 'PDTModel') -> None:
+        """ Stores the values of the reporters in the current step, to the onset or the
+            recorded values depending on whether the model is recording.
+        """
+        values = [model.datacollector.report(name, model) for name in self.reporters]
+        if not model.record:
+            if self._onset_values.size == 2 * self.window:
+                # Only the last two windows are needed, so the oldest window is dropped
+                self._onset_values.view[:self.window] = self._onset_values.view[self.window:]
+                self._onset_values.size = self.window
+            self._onset_values.append(values)
+        else:
+            self._record_values.append(values)
+
+    def is_stationary(self) -> bool:
+        """ Returns whether the means of the last two windows of the onset differ by at most
+            the tolerance for every reporter. Only tested once two full windows are observed.
+        """
+        if self._onset_values.size < 2 * self.window:
+            return False
+        values = self._onset_values.view
+        difference = values[self.window:].mean(axis=0) - values[:self.window].mean(axis=0)
+        return bool(np.all(np.abs(difference) <= self.tolerance))
+
+    def standard_errors(self) -> Dict[str, float]:
+        """ Returns the batch means estimate of the standard error of the mean of every
+            reporter over the recorded steps. Remaining steps that do not fill a batch are left
+            out. Returns NaN while fewer steps than batches are recorded.
+        """
+        values = self._record_values.view
+        batch_size = len(values) // self.batches
+        if batch_size == 0:
+            return {name: float('nan') for name in self.reporters}
+        batch_means = values[:batch_size * self.batches].reshape(
+            self.batches, batch_size, -1).mean(axis=1)
+        errors = batch_means.std(axis=0, ddof=1) / np.sqrt(self.batches)
+        return dict(zip(self.reporters, errors.tolist()))
+
+    def is_precise(self) -> bool:
+        """ Returns whether the standard error of every reporter is at most the target. Batches
+            of less than a window are not tested, as their means are strongly correlated.
+        """
+        if self.target_se is None or self._record_values.size < self.batches * self.window:
+            return False
+        return all(error <= self.target_se for error in self.standard_errors().values())
+
+    def check(self, model: 'PDTModel') -> None:
+        """ Runs the tests at the end of every window, and shortens the onset or recording of
+            the run of the model to the current step if the test succeeds.
+        """
+        if model.run_steps % self.window != 0:
+            return
+        if not model.record:
+            if self.onset_stopped_at is None and model.run_steps < model.T_onset \
+                    and self.is_stationary():
+                self.onset_stopped_at = model.run_steps
+                model.T_onset = model.run_steps
+        elif self.record_stopped_at is None and self.is_precise():
+            self.record_stopped_at = model.run_steps
+            model.T_record = model.run_steps - model.T_onset
+
+    def summary(self, model: 'PDTModel') -> Dict[str, object]:
+        """ Returns the length of the onset and recording of the run, whether they were stopped
+            early and the standard error of every reporter.
+        """
+        summary = {
+            'T_onset': model.T_onset,
+            'T_record': model.T_record,
+            'onset_converged': self.onset_stopped_at is not None,
+            'record_converged': self.record_stopped_at is not None,
+        }
+        for name, error in self.standard_errors().items():
+            summary[name + '_se'] = error
+        return summary
@@ -1,47 +1,359 @@
-""" This file contains the datacollector, extending the datacollector as
-    defined in the MESA framework. 
+""" This file contains the datacollector, which has the interface of the datacollector as
+    defined in the MESA framework. pandas is only imported once a DataFrame is created, as it
+    takes most of the time of importing the model.
 """
-from typing import Dict, Tuple
+import types
+from functools import partial
+from operator import attrgetter
+from typing import TYPE_CHECKING, Dict, List, Tuple
 
 import numpy as np
-import pandas as pd
-from mesa.datacollection import DataCollector
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-class PDTDataCollector(DataCollector):
-    """ Defines the datacollector.
+
+class ColumnBuffer:
+    """ Defines a preallocated buffer of typed rows, stored as a single NumPy array. Rows are
+        written in place, and the buffer doubles its capacity if it runs full.
+    """
+    def __init__(self, row_shape: tuple = (), dtype: np.dtype = float,
+                 capacity: int = 0) -> None:
+        """ Initializes an empty buffer with room for capacity rows of the passed shape and type.
+        """
+        self.size = 0
+        self._data = np.empty((capacity,) + tuple(row_shape), dtype=dtype)
+
+    def reserve(self, capacity: int) -> None:
+        """ Makes sure the buffer has room for at least capacity rows.
+        """
+        if capacity > len(self._data):
+            data = np.empty((capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+            data[:self.size] = self.view
+            self._data = data
+
+    def append(self, row) -> None:
+        """ Writes the row into the first free row of the buffer.
+        """
+        if self.size == len(self._data):
+            self.reserve(max(1, 2 * self.size))
+        self._data[self.size] = row
+        self.size += 1
+
+    def clear(self) -> None:
+        """ Empties the buffer, keeping its capacity.
+        """
+        self.size = 0
+
+    @property
+    def view(self) -> np.ndarray:
+        """ Returns a view on the rows written so far.
+        """
+        return self._data[:self.size]
+
+
+class RunningAggregate:
+    """ Defines a running aggregate of an agent variable, kept per agent over the recorded
+        steps instead of storing the variable of every step. The aggregation is either the
+        sum, the mean, or the count of the steps in which the variable is nonzero.
+    """
+    AGGREGATIONS = ('sum', 'mean', 'count')
+
+    def __init__(self, aggregation: str) -> None:
+        """ Initializes an empty aggregate. The per agent totals are created on the first
+            update, once the number of agents is known.
+        """
+        if aggregation not in self.AGGREGATIONS:
+            raise ValueError(
+                f'aggregation={aggregation} is not one of {self.AGGREGATIONS}')
+        self.aggregation = aggregation
+        self.steps = 0
+        self.total: np.ndarray = None
+
+    def update(self, column: np.ndarray) -> None:
+        """ Adds the values of the agents in the current step to the totals.
+        """
+        if self.aggregation == 'count':
+            column = column != 0
+        if self.total is None:
+            dtype = float if np.issubdtype(column.dtype, np.floating) else np.int64
+            self.total = np.zeros(column.shape, dtype=dtype)
+        self.total += column
+        self.steps += 1
+
+    @property
+    def value(self) -> np.ndarray:
+        """ Returns the aggregated value per agent.
+        """
+        if self.aggregation == 'mean':
+            return self.total / self.steps
+        return self.total
+
+
+class PDTDataCollector:
+    """ Defines the datacollector, with the interface of the MESA datacollector. Instead of its
+        lists, the model reporters are stored as the columns of one preallocated float buffer,
+        and every agent reporter as a buffer with one row of agent values per recorded step.
+        It does not extend the MESA datacollector, as that imports pandas.
+
+        Agent reporters with a streaming aggregation are not stored per step, but only kept as
+        a running aggregate per agent, so their memory does not grow with the recorded steps.
+
+        If a store (see trust.store) is attached, the model variables are written to the store
+        in chunks while the model runs, and only the current chunk is kept in memory.
     """
     def __init__(self, model_reporters: dict = None, agent_reporters: dict = None,
-                 tables: dict = None, proportion_reporters: Dict[str, Tuple[str, str]] = None):
-        """ Initializes the datacollector. In addition to the initialization of the
-            MESA datacollector, proportional reporters are added. In the current implementation
-            this consists of the trust in stranger proportion.
+                 tables: dict = None, proportion_reporters: Dict[str, Tuple[str, str]] = None,
+                 agent_aggregations: Dict[str, str] = None):
+        """ Initializes the datacollector. The reporters and tables are registered as in the
+            MESA datacollector, but the storage is replaced by buffers. In addition,
+            proportional reporters are added. In the current implementation this consists of
+            the trust in stranger proportion. agent_aggregations maps the names of agent
+            reporters to the aggregation ('sum', 'mean' or 'count') with which they are streamed.
         """
-        super().__init__(model_reporters, agent_reporters, tables)
+        self.model_reporters = {}
+        self.agent_reporters = {}
+        self.tables = {}
+
+        for name, reporter in (model_reporters or {}).items():
+            self._new_model_reporter(name, reporter)
+        for name, reporter in (agent_reporters or {}).items():
+            self._new_agent_reporter(name, reporter)
+        for name, columns in (tables or {}).items():
+            self._new_table(name, columns)
+
         self.proportion_reporters = proportion_reporters
+        self.agent_aggregations = agent_aggregations or {}
+        unknown = set(self.agent_aggregations) - set(self.agent_reporters)
+        if unknown:
+            raise ValueError(f'Aggregations for unknown agent reporters: {unknown}')
 
-    def _get_agents_vars_sum(self):
-        """ TODO
+        self._model_buffer = ColumnBuffer((len(self.model_reporters),))
+        self._steps_buffer = ColumnBuffer(dtype=int)
+        # Created on the first collect, once the number of agents and their types are known
+        self._agent_buffers: Dict[str, ColumnBuffer] = None
+        self._agent_aggregates = {name: RunningAggregate(aggregation)
+                                  for name, aggregation in self.agent_aggregations.items()}
+        self._unique_ids: np.ndarray = None
+        self._capacity = 0
+
+        self.store = None
+        self._chunk_size: int = None
+        # The number of recorded steps that have been written to the store
+        self.flushed = 0
+
+    def _new_model_reporter(self, name, reporter):
+        """ Adds a new model-level reporter to collect. Its values are stored in the column of
+            the model buffer in the order of registration.
+        """
+        if type(reporter) is str:
+            reporter = partial(self._getattr, reporter)
+        self.model_reporters[name] = reporter
+
+    def _new_agent_reporter(self, name, reporter):
+        """ Adds a new agent-level reporter to collect. Reporters given as the name of an
+            agent attribute keep that name, so they can be read without calling them.
+        """
+        if type(reporter) is str:
+            attribute_name = reporter
+            reporter = partial(self._getattr, reporter)
+            reporter.attribute_name = attribute_name
+        self.agent_reporters[name] = reporter
+
+    def _new_table(self, table_name, table_columns):
+        """ Adds a new table that objects can write to, with the passed columns.
+        """
+        self.tables[table_name] = {column: [] for column in table_columns}
+
+    @staticmethod
+    def _getattr(name, _object):
+        """ Turns around the arguments of getattr to make it partially callable.
         """
-        agent_vars_sum = {}
-        records = self._agent_records.values()
-        records = np.array(list(records))
+        return getattr(_object, name, None)
 
-        rep_names = self.agent_reporters.keys()
-        for i, rep_name in zip(range(2, 2 + len(rep_names)), rep_names):
-            summed_var = np.sum(records[:, :, i], axis=0)
-            agent_vars_sum[rep_name] = summed_var
-        
+    def _reporter_decorator(self, reporter):
+        return reporter()
+
+    def add_table_row(self, table_name, row, ignore_missing=False):
+        """ Adds a row dictionary to the table with the passed name. Missing columns are
+            filled with None if ignore_missing is set, and raise an error otherwise.
+        """
+        if table_name not in self.tables:
+            raise Exception("Table does not exist.")
+
+        for column in self.tables[table_name]:
+            if column in row:
+                self.tables[table_name][column].append(row[column])
+            elif ignore_missing:
+                self.tables[table_name][column].append(None)
+            else:
+                raise Exception("Could not insert row with missing column")
+
+    def reserve(self, num_steps: int) -> None:
+        """ Preallocates the buffers for the passed number of steps to be recorded, on top of
+            the steps recorded so far.
+        """
+        self._capacity = self._steps_buffer.size + num_steps
+        if self._chunk_size is not None:
+            self._capacity = min(self._capacity, self._chunk_size)
+        self._model_buffer.reserve(self._capacity)
+        self._steps_buffer.reserve(self._capacity)
+        if self._agent_buffers is not None:
+            for buffer in self._agent_buffers.values():
+                buffer.reserve(self._capacity)
+
+    def _report_model(self, reporter, model):
+        """ Calls the model reporter in the same way the MESA datacollector does.
+        """
+        if isinstance(reporter, (types.LambdaType, partial)):
+            return reporter(model)
+        if isinstance(reporter, list):
+            return reporter[0](*reporter[1])
+        return self._reporter_decorator(reporter)
+
+    def report(self, name: str, model):
+        """ Returns the current value of the model reporter with the passed name, without
+            recording it.
+        """
+        return self._report_model(self.model_reporters[name], model)
+
+    def _record_agents(self, model) -> List[np.ndarray]:
+        """ Returns the values of every agent reporter as an array over all agents. Schedules
+            that store the state of the agents as arrays (see trust.vectorized.Population)
+            expose the reported attributes as arrays directly.
+        """
+        schedule = model.schedule
+        if hasattr(schedule, 'unique_ids'):
+            if self._unique_ids is None:
+                self._unique_ids = schedule.unique_ids
+            return [np.asarray(getattr(schedule, rep.attribute_name))
+                    for rep in self.agent_reporters.values()]
+
+        agents = schedule.agents
+        if self._unique_ids is None:
+            self._unique_ids = np.array([agent.unique_id for agent in agents])
+        columns = []
+        for rep in self.agent_reporters.values():
+            if hasattr(rep, 'attribute_name'):
+                rep = attrgetter(rep.attribute_name)
+            columns.append(np.array(list(map(rep, agents))))
+        return columns
+
+    def collect(self, model):
+        """ Collects all the data for the given model object, writing it into the buffers.
+        """
+        self._steps_buffer.append(model.schedule.steps)
+        self._model_buffer.append([self._report_model(reporter, model)
+                                   for reporter in self.model_reporters.values()])
+
+        if self.agent_reporters:
+            columns = dict(zip(self.agent_reporters, self._record_agents(model)))
+            for name, aggregate in self._agent_aggregates.items():
+                aggregate.update(columns.pop(name))
+
+            if self._agent_buffers is None:
+                self._agent_buffers = {name: ColumnBuffer(column.shape, column.dtype,
+                                                          self._capacity)
+                                       for name, column in columns.items()}
+            for name, column in columns.items():
+                self._agent_buffers[name].append(column)
+
+        if self._chunk_size is not None and self._model_buffer.size >= self._chunk_size:
+            self.flush()
+
+    def attach_store(self, store, chunk_size: int = None) -> None:
+        """ Attaches a store to which the model variables are written. If a chunk size is
+            passed, the recorded steps are written whenever the chunk is full, otherwise they
+            are only written by calling flush. Per step agent variables are not written and
+            remain in memory, so agent reporters should be streamed when using chunks.
+        """
+        self.store = store
+        self._chunk_size = chunk_size
+
+    def __getstate__(self) -> dict:
+        """ Returns the state of the datacollector for pickling, without the attached store.
+        """
+        state = self.__dict__.copy()
+        state['store'] = None
+        state['_chunk_size'] = None
+        return state
+
+    def flush(self) -> None:
+        """ Writes the model variables recorded since the last flush to the attached store,
+            after which they are removed from memory.
+        """
+        if self._model_buffer.size == 0:
+            return
+        self.store.write(self.get_model_vars_dataframe())
+        self.flushed += self._model_buffer.size
+        self._model_buffer.clear()
+        if not self._agent_buffers:
+            self._steps_buffer.clear()
+
+    @property
+    def model_vars(self) -> Dict[str, np.ndarray]:
+        """ Returns the recorded values of every model reporter, as views on the model buffer.
+            Values that have been flushed to the store are not included.
+        """
+        values = self._model_buffer.view
+        return {name: values[:, i] for i, name in enumerate(self.model_reporters)}
+
+    def get_model_vars_dataframe(self) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame from the model variables, as a view on the model buffer.
+            The index is the recorded step. Values that have been flushed to the store are
+            not included.
+        """
+        import pandas as pd
+
+        index = pd.RangeIndex(self.flushed, self.flushed + self._model_buffer.size)
+        return pd.DataFrame(self._model_buffer.view, columns=list(self.model_reporters),
+                            index=index, copy=False)
+
+    def get_agent_vars_dataframe(self) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame from the agent variables, with one column for each
+            variable and the step and agent id as index. Streamed variables are not included.
+        """
+        import pandas as pd
+
+        steps = self._steps_buffer.view
+        index = pd.MultiIndex.from_arrays([
+            np.repeat(steps, len(self._unique_ids)),
+            np.tile(self._unique_ids, len(steps)),
+        ], names=["Step", "AgentID"])
+        return pd.DataFrame({name: buffer.view.ravel()
+                             for name, buffer in self._agent_buffers.items()}, index=index)
+
+    def get_agent_vars_aggregate_dataframe(self) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame with the aggregate of every streamed agent variable,
+            per agent.
+        """
+        import pandas as pd
+
+        return pd.DataFrame({name: aggregate.value
+                             for name, aggregate in self._agent_aggregates.items()})
+
+    def _get_agents_vars_sum(self):
+        """ Returns the sum over all recorded steps of every agent variable, per agent. For the
+            streamed variables, this is the running total of their aggregate.
+        """
+        agent_vars_sum = {name: buffer.view.sum(axis=0)
+                          for name, buffer in (self._agent_buffers or {}).items()}
+        for name, aggregate in self._agent_aggregates.items():
+            agent_vars_sum[name] = aggregate.total
         return agent_vars_sum
 
-    def get_agent_vars_sum_dataframe(self):
-        """ TODO
+    def get_agent_vars_sum_dataframe(self) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame with the sum over all recorded steps of every agent
+            variable, per agent.
         """
+        import pandas as pd
+
         agent_vars_sum = self._get_agents_vars_sum()
         return pd.DataFrame(agent_vars_sum)
 
     def _get_proportions(self):
-        """ TODO
+        """ Returns every proportion reporter per agent, which is the sum of the first agent
+            variable divided by the sum of the second agent variable.
         """
         agent_proportions_vars = {}
         agent_vars_sum = self._get_agents_vars_sum()
@@ -51,11 +363,22 @@ class PDTDataCollector(DataCollector):
             b = agent_vars_sum[prop_names[1]]
             prop = a/b
             agent_proportions_vars[rep_name] = prop
-        
+
         return agent_proportions_vars
-            
-    def get_agent_props_dataframe(self):
-        """ TODO
+
+    def get_agent_props_dataframe(self) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame with the proportion reporters per agent.
         """
+        import pandas as pd
+
         agent_proportions = self._get_proportions()
         return pd.DataFrame(agent_proportions)
+
+    def get_table_dataframe(self, table_name) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame from the table with the passed name.
+        """
+        import pandas as pd
+
+        if table_name not in self.tables:
+            raise Exception("No such table.")
+        return pd.DataFrame(self.tables[table_name])
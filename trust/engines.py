@@ -0,0 +1,18 @@
+""" This file contains the engines with which the PDTModel can be run.
+"""
+from trust.compiled import CompiledPDTModel
+from trust.model import PDTModel
+from trust.vectorized import VectorizedPDTModel
+
+ENGINES = {
+    'agent': PDTModel,
+    'vectorized': VectorizedPDTModel,
+    'compiled': CompiledPDTModel,
+}
+
+
+def create_model(engine: str = 'agent', **kwargs) -> PDTModel:
+    """ Creates the model of the passed engine (default agent, the agent based PDTModel).
+        kwargs are passed on to the __init__ of the model.
+    """
+    return ENGINES[engine](**kwargs)
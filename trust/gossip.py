@@ -0,0 +1,221 @@
+""" This file contains the gossip store, which holds the memories of all gossip agents of the
+    model in shared arrays instead of a dictionary per agent.
+"""
+from array import array
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+class GossipStore:
+    """ Defines the memories of the encounters of all agents. Every agent has memory_size
+        slots, each holding the id of a partner, whether the encounter with that partner was
+        positive and when it was last written. Once all slots are full, a new partner replaces
+        the partner that was written least recently. Memorizing a known partner again updates
+        its outcome and makes it the most recently written, as in a dict that moves every
+        written key to its end.
+
+        Every agent also has a small hash table from the id of a partner to its slot, using
+        linear probing, so a lookup does not search the ring buffer. All ring buffers and hash
+        tables are stored in flat typed arrays, so lookups and inserts do not allocate.
+
+        The memories of many agents can be looked up and memorized at once with get_many and
+        memorize_many, which search the ring buffers as arrays. A store that is only used in
+        this way (as by the vectorized engine) is created without hash tables.
+    """
+    def __init__(self, num_agents: int, memory_size: int, indexed: bool = True) -> None:
+        """ Initializes empty memories for the passed number of agents, of which every agent
+            can memorize memory_size partners. indexed is whether the hash tables are kept,
+            which makes get and memorize faster and memorize_many slower.
+        """
+        if not 0 <= memory_size < 2 ** 15:
+            raise ValueError(f'memory_size={memory_size} should be in [0, {2 ** 15})')
+        self.num_agents = num_agents
+        self.memory_size = memory_size
+        self.indexed = indexed
+        # The hash tables are at most half full, so every probe ends at an empty entry
+        self._table_size = 1 << max(0, 2 * memory_size - 1).bit_length()
+
+        # The partner in every slot, -1 if the slot is empty
+        self._partners = array('i', [-1]) * (num_agents * memory_size)
+        self._outcomes = array('b', [0]) * (num_agents * memory_size)
+        # The number of writes of every agent, and the write at which every slot was last
+        # written (-1 if the slot is empty, so empty slots are filled first and in order)
+        self._writes = array('i', [0]) * num_agents
+        self._written = array('i', [-1]) * (num_agents * memory_size)
+        # The slot of the partner in every entry of the hash tables, -1 if the entry is empty
+        self._table = array('h', [-1]) * (num_agents * self._table_size if indexed else 0)
+
+    @property
+    def partners(self) -> np.ndarray:
+        """ Returns the partner in every slot of every agent (-1 if empty), as a view.
+        """
+        return np.frombuffer(self._partners, dtype=np.int32).reshape(
+            self.num_agents, self.memory_size)
+
+    @property
+    def outcomes(self) -> np.ndarray:
+        """ Returns the outcome in every slot of every agent, as a view.
+        """
+        return np.frombuffer(self._outcomes, dtype=np.int8).reshape(
+            self.num_agents, self.memory_size).view(bool)
+
+    @property
+    def writes(self) -> np.ndarray:
+        """ Returns the number of writes of every agent, as a view.
+        """
+        return np.frombuffer(self._writes, dtype=np.int32)
+
+    @property
+    def written(self) -> np.ndarray:
+        """ Returns the write at which every slot of every agent was last written (-1 if
+            empty), as a view.
+        """
+        return np.frombuffer(self._written, dtype=np.int32).reshape(
+            self.num_agents, self.memory_size)
+
+    def _least_recent(self, agent_id: int) -> int:
+        """ Returns the slot of the agent that was written least recently, the first empty
+            slot if there is one.
+        """
+        offset = agent_id * self.memory_size
+        written = self._written[offset:offset + self.memory_size]
+        return written.index(min(written))
+
+    def _write(self, agent_id: int, slot: int, outcome: bool) -> None:
+        """ Writes the outcome into the slot of the agent, and marks it as most recent.
+        """
+        offset = agent_id * self.memory_size
+        self._outcomes[offset + slot] = outcome
+        self._written[offset + slot] = self._writes[agent_id]
+        self._writes[agent_id] += 1
+
+    def _find(self, agent_id: int, partner_id: int) -> int:
+        """ Returns the position in the hash table of the agent that holds the partner, or of
+            the empty entry at which the partner would be inserted.
+        """
+        mask = self._table_size - 1
+        base = agent_id * self._table_size
+        offset = agent_id * self.memory_size
+        table = self._table
+        partners = self._partners
+        i = partner_id & mask
+        while True:
+            slot = table[base + i]
+            if slot < 0 or partners[offset + slot] == partner_id:
+                return base + i
+            i = (i + 1) & mask
+
+    def _remove(self, agent_id: int, position: int) -> None:
+        """ Removes the entry at the position from the hash table of the agent. The entries
+            after it are shifted back, so no probe sequence is broken by the empty entry.
+        """
+        mask = self._table_size - 1
+        base = agent_id * self._table_size
+        offset = agent_id * self.memory_size
+        table = self._table
+        i = j = position - base
+        while True:
+            j = (j + 1) & mask
+            slot = table[base + j]
+            if slot < 0:
+                break
+            home = self._partners[offset + slot] & mask
+            # An entry stays if its home lies cyclically in (i, j]
+            if (i < home <= j) if i <= j else (i < home or home <= j):
+                continue
+            table[base + i] = slot
+            i = j
+        table[base + i] = -1
+
+    def _search(self, agent_id: int, partner_id: int) -> int:
+        """ Returns the slot of the agent that holds the partner, or -1 if there is none, by
+            searching the ring buffer of the agent. Used when there are no hash tables.
+        """
+        offset = agent_id * self.memory_size
+        try:
+            return self._partners.index(partner_id, offset, offset + self.memory_size) - offset
+        except ValueError:
+            return -1
+
+    def get(self, agent_id: int, partner_id: int) -> Optional[bool]:
+        """ Returns whether the memorized encounter of the agent with the partner was
+            positive, or None if the agent has no memory of the partner.
+        """
+        if self.indexed:
+            slot = self._table[self._find(agent_id, partner_id)]
+        else:
+            slot = self._search(agent_id, partner_id)
+        if slot < 0:
+            return None
+        return self._outcomes[agent_id * self.memory_size + slot] == 1
+
+    def memorize(self, agent_id: int, partner_id: int, outcome: bool) -> None:
+        """ Memorizes whether the encounter of the agent with the partner was positive.
+        """
+        if self.memory_size == 0:
+            return
+        offset = agent_id * self.memory_size
+        if not self.indexed:
+            slot = self._search(agent_id, partner_id)
+            if slot < 0:
+                slot = self._least_recent(agent_id)
+                self._partners[offset + slot] = partner_id
+            self._write(agent_id, slot, outcome)
+            return
+
+        position = self._find(agent_id, partner_id)
+        slot = self._table[position]
+        if slot < 0:
+            slot = self._least_recent(agent_id)
+            forgotten = self._partners[offset + slot]
+            if forgotten >= 0:
+                self._remove(agent_id, self._find(agent_id, forgotten))
+                # Removing may have shifted the empty entry of the partner
+                position = self._find(agent_id, partner_id)
+            self._partners[offset + slot] = partner_id
+            self._table[position] = slot
+        self._write(agent_id, slot, outcome)
+
+    def memories(self, agent_id: int) -> Dict[int, bool]:
+        """ Returns the memories of the agent as a dictionary from partner id to outcome, from
+            the least to the most recently written.
+        """
+        offset = agent_id * self.memory_size
+        slots = sorted((written, slot) for slot, written in enumerate(
+            self._written[offset:offset + self.memory_size]) if written >= 0)
+        return {self._partners[offset + slot]: self._outcomes[offset + slot] == 1
+                for _, slot in slots}
+
+    def get_many(self, agent_ids: np.ndarray, partner_ids: np.ndarray
+                 ) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns for every pair of an agent and a partner whether the agent has a memory of
+            the partner, and whether the memorized encounter was positive (False if there is
+            no memory).
+        """
+        if self.memory_size == 0:
+            return np.zeros(len(agent_ids), dtype=bool), np.zeros(len(agent_ids), dtype=bool)
+        matches = self.partners[agent_ids] == partner_ids[:, None]
+        return matches.any(axis=1), (matches & self.outcomes[agent_ids]).any(axis=1)
+
+    def memorize_many(self, agent_ids: np.ndarray, partner_ids: np.ndarray,
+                      outcomes: np.ndarray) -> None:
+        """ Memorizes for every pair of an agent and a partner whether the encounter was
+            positive, as memorize does. Every agent may occur only once.
+        """
+        if self.memory_size == 0:
+            return
+        if self.indexed:
+            for agent_id, partner_id, outcome in zip(
+                    agent_ids.tolist(), partner_ids.tolist(), outcomes.tolist()):
+                self.memorize(agent_id, partner_id, outcome)
+            return
+
+        partners, writes = self.partners, self.writes
+        matches = partners[agent_ids] == partner_ids[:, None]
+        known = matches.any(axis=1)
+        slots = np.where(known, matches.argmax(axis=1), self.written[agent_ids].argmin(axis=1))
+        partners[agent_ids, slots] = partner_ids
+        self.outcomes[agent_ids, slots] = outcomes
+        self.written[agent_ids, slots] = writes[agent_ids]
+        writes[agent_ids] += 1
@@ -0,0 +1,54 @@
+""" This file contains the array kernels of the prisoners' dilemma, which decide and pay out a
+    whole set of pairs at once. They are shared by the Network of the agent engine and the
+    ArrayNetwork of the vectorized engine.
+"""
+from typing import TYPE_CHECKING, Dict, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from numpy.random import Generator
+    from trust.choice import PDTChoice
+
+
+def payoff_matrix(pdt_payoff: 'Dict[Tuple[PDTChoice, PDTChoice], float]') -> np.ndarray:
+    """ Returns the payoffs (without opportunity cost) as a 2x2 matrix, indexed by the values
+        of the choice of the agent and the choice of its partner.
+    """
+    matrix = np.zeros((2, 2))
+    for (choice, partner_choice), payoff in pdt_payoff.items():
+        matrix[choice.value, partner_choice.value] = payoff
+    return matrix
+
+
+def decide_play(rng: 'Generator', trust_prob: np.ndarray, stranger: np.ndarray,
+                reads_signals: bool, partner_trustworthiness: np.ndarray = None,
+                partner_cooperates: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """ Decides for a set of agents whether to play or exit the prisoners' dilemma, and returns
+        the decisions together with whether the agents trusted their propensity to play (for
+        agents that read signals, whether they read the signal of their partner).
+
+        Agents that do not read signals play with their propensity to play (MSAgent). Agents
+        that read signals either read the signal of the cooperation of their partner, or only
+        play with partners that are not strangers (WHAgent). The signal is ambivalent at a
+        trustworthiness of 0.5 and perfect at either 0 or 1.
+    """
+    trusting = rng.random(len(trust_prob)) < trust_prob
+    if not reads_signals:
+        return trusting, trusting
+
+    signal_correctness = 0.5 + np.abs(partner_trustworthiness - 0.5)
+    correct = rng.random(len(trust_prob)) < signal_correctness
+    signal = partner_cooperates == correct
+    return np.where(trusting, signal, ~stranger), trusting
+
+
+def pdt_payoffs(matrix: np.ndarray, cooperates: np.ndarray, partner_cooperates: np.ndarray,
+                both_play: np.ndarray, opportunity_cost, exit_payoff: float) -> np.ndarray:
+    """ Returns the payoffs of a set of agents given the choices of the agents and their
+        partners. Agents of which the partner cooperates pay half of the opportunity cost,
+        and agents in pairs where at least one of the agents exits receive the exit payoff.
+    """
+    payoffs = matrix[cooperates.astype(int), partner_cooperates.astype(int)] \
+        - 0.5 * opportunity_cost * partner_cooperates
+    return np.where(both_play, payoffs, exit_payoff)
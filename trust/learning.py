@@ -0,0 +1,182 @@
+""" This file contains the learners, which update the propensities of all paired agents of the
+    model at once instead of agent by agent. A learner is registered for an agent class, and is
+    used for the subclasses of that class that do not change how the agents learn.
+"""
+from operator import attrgetter
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+from trust.agent import BaseAgent, RLAgent, WHAgent
+from trust.choice import PDTChoice
+
+if TYPE_CHECKING:
+    from trust.model import PDTModel
+
+
+LEARNERS: Dict[type, Type['StochasticLearner']] = {}
+
+
+def register_learner(AgentClass: type):
+    """ Returns a class decorator that registers the learner for the passed agent class.
+    """
+    def register(Learner: Type['StochasticLearner']) -> Type['StochasticLearner']:
+        LEARNERS[AgentClass] = Learner
+        return Learner
+    return register
+
+
+def get_learner(model: 'PDTModel', AgentClass: type) -> Optional['StochasticLearner']:
+    """ Returns the learner registered for the agent class or its closest base class, or None
+        if there is none, or if the agent class overrides a method replaced by the learner. The
+        agents then update their propensities one by one.
+    """
+    for cls in AgentClass.__mro__:
+        if cls in LEARNERS:
+            Learner = LEARNERS[cls]
+            if all(getattr(AgentClass, name) is getattr(cls, name) for name in Learner.replaces):
+                return Learner(model)
+            return None
+    return None
+
+
+def _gather(agents: List[BaseAgent], name: str, dtype: type = float) -> np.ndarray:
+    """ Returns the attribute of the passed agents as an array.
+    """
+    return np.fromiter(map(attrgetter(name), agents), dtype, len(agents))
+
+
+def stochastic_learning(prob: np.ndarray, payoff: np.ndarray) -> np.ndarray:
+    """ Calculates and returns the new values according to the stochastic learning rate given
+        the probabilities and payoffs. See BaseAgent.stochastic_learning.
+    """
+    return np.where(payoff >= 0, prob + (1 - prob) * payoff, prob + prob * payoff)
+
+
+def reinforcement_learning(prob: np.ndarray, payoff: np.ndarray,
+                           learning_rate: np.ndarray) -> np.ndarray:
+    """ Calculates and returns the new values according to the reinforcement learning rate
+        given the probabilities, (relative) payoffs and learning rates. See
+        RLAgent.stochastic_learning.
+    """
+    return np.where(payoff >= 0, prob + learning_rate * (1 - prob) * payoff,
+                    prob + learning_rate * prob * payoff)
+
+
+@register_learner(BaseAgent)
+class StochasticLearner:
+    """ Defines the learner of the BaseAgent. The propensity to enter the market, to cooperate
+        and to play are reinforced if the agent took the action, and weakened otherwise, by
+        stochastic learning. With the social learning rate, an agent copies the propensity of
+        the role model of its neighbourhood instead.
+
+        Subclasses change the actions on which the propensities are updated, or the learning
+        rule, and are registered for their agent class with register_learner.
+    """
+    # The methods of the agents of which the learner replaces the per agent version
+    replaces: Tuple[str, ...] = ('update_behaviour', 'update_propensity', 'stochastic_learning')
+
+    def __init__(self, model: 'PDTModel') -> None:
+        """ Initializes the learner of the passed model.
+        """
+        self.model = model
+
+    def actions(self, agents: List[BaseAgent]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Returns for the passed agents whether they took the action of the propensity to
+            enter the market, to cooperate and to play respectively.
+        """
+        cooperated = np.fromiter((agent.pdtchoice is PDTChoice.COOPERATE for agent in agents),
+                                 bool, len(agents))
+        return (_gather(agents, 'in_market', bool), cooperated, _gather(agents, 'play', bool))
+
+    def prepare(self, agents: List[BaseAgent]) -> None:
+        """ Reads the parameters of the learning rule from the passed agents, before their
+            propensities are updated.
+        """
+        self._payoff = _gather(agents, 'payoff')
+
+    def learn(self, prob: np.ndarray) -> np.ndarray:
+        """ Returns the reinforced propensities of the agents passed to prepare.
+        """
+        return stochastic_learning(prob, self._payoff)
+
+    def update(self, agents: List[BaseAgent]) -> None:
+        """ Updates the propensities of all paired agents. The passed agents are all agents of
+            the model, ordered by their unique id (which are 0 to N-1 as created by the model).
+
+            Agents finalize in the order of their unique id, so an agent copies the already
+            updated propensity of a role model with a lower id. As a role model never learns
+            socially from itself, its updated propensity does not depend on the copying.
+        """
+        ids = np.flatnonzero(_gather(agents, 'paired', bool))
+        paired = [agents[i] for i in ids]
+        if not paired:
+            return
+
+        role_models = self.model.network.role_models
+        role_ids = np.fromiter((-1 if role_model is None else role_model.unique_id
+                                for role_model in (role_models[agent.neighbourhood]
+                                                   for agent in paired)), int, len(paired))
+        social_learning = (role_ids >= 0) & (role_ids != ids)
+        role_ids = np.where(social_learning, role_ids, ids)
+        social_learning_rate = _gather(paired, 'social_learning_rate')
+
+        self.prepare(paired)
+        rng = self.model.rng.generator
+        propensities = []
+        for name, action in zip(('location_prob', 'trustworthiness_prob', 'trust_prob'),
+                                self.actions(paired)):
+            prob = _gather(agents, name)
+            learned = np.where(action, self.learn(prob[ids]), 1 - self.learn(1 - prob[ids]))
+
+            updated = prob.copy()
+            updated[ids] = learned
+            role_prob = np.where(role_ids < ids, updated[role_ids], prob[role_ids])
+            copying = social_learning & (rng.random(len(ids)) < social_learning_rate)
+            propensities.append(np.where(copying, role_prob, learned))
+
+            if name == 'trust_prob':
+                self.model.trust_prob_sum += propensities[-1].sum() - prob[ids].sum()
+
+        for agent, location_prob, trustworthiness_prob, trust_prob in zip(
+                paired, *(propensity.tolist() for propensity in propensities)):
+            agent.location_prob = location_prob
+            agent.trustworthiness_prob = trustworthiness_prob
+            agent.trust_prob = trust_prob
+
+
+@register_learner(WHAgent)
+class SignalLearner(StochasticLearner):
+    """ Defines the learner of the WHAgent, which updates the propensity to play on whether the
+        agent read the signal of its partner. See WHAgent.update_behaviour.
+    """
+    def actions(self, agents: List[BaseAgent]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Returns for the passed agents whether they entered the market, defected and read
+            the signal of their partner respectively.
+        """
+        defected = np.fromiter((agent.pdtchoice is not PDTChoice.COOPERATE for agent in agents),
+                               bool, len(agents))
+        return (_gather(agents, 'in_market', bool), defected,
+                _gather(agents, 'read_signal', bool))
+
+
+@register_learner(RLAgent)
+class ReinforcementLearner(SignalLearner):
+    """ Defines the learner of the RLAgent, which learns with the reinforcement learning rule,
+        optionally from the reward relative to its average reward.
+    """
+    def prepare(self, agents: List[BaseAgent]) -> None:
+        """ Reads the payoffs and learning rates of the passed agents. For agents with a
+            relative reward, the average reward is subtracted from the payoff.
+        """
+        payoff = _gather(agents, 'payoff')
+        n_payoffs = _gather(agents, 'n_payoffs')
+        relative = _gather(agents, 'relative_reward', bool) & (n_payoffs > 0)
+        average = _gather(agents, 'cumulative_payoff') / np.where(relative, n_payoffs, 1)
+        self._payoff = np.where(relative, payoff - average, payoff)
+        self._learning_rate = _gather(agents, 'learning_rate')
+
+    def learn(self, prob: np.ndarray) -> np.ndarray:
+        """ Returns the reinforced propensities of the agents passed to prepare.
+        """
+        return reinforcement_learning(prob, self._payoff, self._learning_rate)
@@ -1,17 +1,30 @@
 """ This file contains the PDTModel and all its associated funtionality.
 """
 
-from typing import Union
+import gc
+import gzip
+import pickle
+import random
+import time
+from typing import TYPE_CHECKING, Sequence, Union
 
-import numpy as np
 from mesa import Model
 
 import trust.agent as agent_module
-from trust.activation import TwoStepActivation 
-from trust.agent import *
+from trust.activation import TwoStepActivation
+from trust.agent import MSAgent
 from trust.choice import PDTChoice
 from trust.datacollector import PDTDataCollector
+from trust.learning import get_learner
+from trust.neighbourhoods import assign_neighbourhoods, count_neighbourhoods
 from trust.network import Network
+from trust.rng import RandomStream
+from trust.timing import PhaseTimer
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from trust.convergence import ConvergenceDetector
 
 
 class PDTModel(Model):
@@ -24,6 +37,9 @@ class PDTModel(Model):
                    }
     _EXIT_PAYOFF = -0.2
 
+    # Times the phases of every step if set, see enable_timing
+    timer: 'PhaseTimer' = None
+
     def get_opportunity_cost(self, neighbourhood_size: int) -> float:
         """ Calculates and returns the opportunity costs (1 - (n-1)/(N-1)).
         """
@@ -45,41 +61,79 @@ class PDTModel(Model):
         return PDTModel._EXIT_PAYOFF
 
     def __init__(self, AgentClass: Union[str, type] = MSAgent, number_of_agents: int = 1000,
-                 neighbourhood_size: int = 50, mobility_rate: float = 0.2, **kwargs) -> None:
+                 neighbourhood_size: int = 50, mobility_rate: float = 0.2, seed: int = None,
+                 neighbourhood_sizes: Union[str, Sequence[int]] = 'equal',
+                 size_variation: float = 0.5, **kwargs) -> None:
         """ Initializes the model. Can take parameters defining the agent type. Passing a str
             of the class also suffices (default MSAgent), population size N (default 1000),
-            neighbourhood size (default 50) and mobility rate (default 0.2). kwargs are keyword
-            arguments that are passed on to the __init__ of RLAgent. Check implementation
+            neighbourhood size (default 50), mobility rate (default 0.2) and the seed of the
+            random number stream of the agents (default None). neighbourhood_sizes is the
+            layout of the neighbourhoods, of which size_variation is the coefficient of
+            variation of the lognormal layout (see trust.neighbourhoods). kwargs are
+            keyword arguments that are passed on to the __init__ of RLAgent. Check implementation
             for available args.
 
-            The number of neighbourhoods n is calculated, after which a network with n
-            neighbourhoods is created. Additionaly, a scheduler (as defined in activation.py)
-            is created. All agents are distributed amongst the neighbourhoods and added to
-            the scheduler. Besides this, a datacollector is set up and initialized in order
-            to be able to record and later analyze the results of the model.
-            
-            TODO: update this info if the clustering has been changed. 
+            The number of neighbourhoods n is calculated (or taken from the passed sizes),
+            after which a network with n neighbourhoods is created. Additionaly, a scheduler
+            (as defined in activation.py) is created. All agents are distributed amongst the
+            neighbourhoods, and added to the network and the scheduler at once. Besides this,
+            a datacollector is set up and initialized in order to be able to record and later
+            analyze the results of the model.
         """
 
         self.num_agents = number_of_agents
-        self.num_neighbourhoods = int(self.num_agents / neighbourhood_size)
+        self.num_neighbourhoods = count_neighbourhoods(number_of_agents, neighbourhood_size,
+                                                       neighbourhood_sizes)
+        self.neighbourhood_sizes = neighbourhood_sizes
+        self.size_variation = size_variation
 
         self.network = Network(self, self.num_neighbourhoods)
         self.schedule = TwoStepActivation(self)
 
         self.mobility_rate = mobility_rate
+        self.rng = RandomStream(seed)
+        # Created by the first gossip agent
+        self.gossip = None
 
         if isinstance(AgentClass, str):
             AgentClass = getattr(agent_module, AgentClass)
 
-        for i in range(self.num_agents):
-            neighbourhood = int(i % self.num_neighbourhoods)
-            # TODO: Cluster agent location into neighborhoods of randomly varying size.
-            agent = AgentClass(i, self, neighbourhood, **kwargs)
-            self.schedule.add(agent)
-            self.network.add_agent_to_neighbourhood(agent, neighbourhood)
+        neighbourhoods = self._assign_neighbourhoods()
+        # Nothing created here becomes garbage, while the cyclic garbage collector would
+        # otherwise traverse all agents created so far over and over again
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            agents = [AgentClass(i, self, neighbourhood, **kwargs)
+                      for i, neighbourhood in enumerate(neighbourhoods.tolist())]
+            self.schedule.add_agents(agents)
+            self.network.add_agents(agents, neighbourhoods)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        # Kept up to date by the agents, for the mean propensity to trust
+        self.trust_prob_sum = sum(a.trust_prob for a in self.schedule.agents)
+        # Updates the propensities of all paired agents at once, if the agents allow it
+        self.learner = get_learner(self, AgentClass)
+
+        self.record = False
+        self.convergence = None
+        self.datacollector = self._create_datacollector()
 
-        self.datacollector = PDTDataCollector(model_reporters={
+    def _assign_neighbourhoods(self) -> 'np.ndarray':
+        """ Returns the neighbourhood of every agent, in the layout of the model. Random
+            layouts are drawn before the agents draw their propensities.
+        """
+        return assign_neighbourhoods(self.num_agents, self.num_neighbourhoods,
+                                     self.neighbourhood_sizes, self.rng.generator,
+                                     self.size_variation)
+
+    def _create_datacollector(self) -> PDTDataCollector:
+        """ Creates the datacollector with the model, agent and proportion reporters
+            recorded by the model.
+        """
+        return PDTDataCollector(model_reporters={
             "Market_Size": self._market_size,
             "Trust_in_Strangers": self._trust_in_strangers,
             "Signal_Reading": self._signal_reading,
@@ -92,6 +146,9 @@ class PDTModel(Model):
             "Paired_with_Stranger_agent": "paired_with_stranger"
         }, proportion_reporters={
             "Trust_in_Stranger_proportion": ("Trust_in_Strangers_agent", "Paired_with_Stranger_agent")
+        }, agent_aggregations={
+            "Trust_in_Strangers_agent": "sum",
+            "Paired_with_Stranger_agent": "sum"
         })
 
     def step(self):
@@ -102,80 +159,195 @@ class PDTModel(Model):
             game. If needed, the data is stored in the datacollector. Finally, it lets the scheduler
             execute the finalize method for all agents (and move to the next step).
         """
+        if self.timer is not None:
+            return self._timed_step(self.timer)
+
+        self.schedule.step()
+        self.network.pair_and_play()
+
+        if self.record:
+            self.datacollector.collect(self)
+        if self.convergence is not None:
+            self.convergence.observe(self)
+        self.schedule.finalize()
+
+    def _timed_step(self, timer: 'PhaseTimer') -> None:
+        """ Executes the step, adding the time of every phase to the timer.
+        """
+        start = time.perf_counter()
         self.schedule.step()
+        timer.add('schedule.step', time.perf_counter() - start)
+
+        start = time.perf_counter()
         self.network.pair_and_play()
+        timer.add('network.pair_and_play', time.perf_counter() - start)
 
         if self.record:
+            start = time.perf_counter()
             self.datacollector.collect(self)
+            timer.add('datacollector.collect', time.perf_counter() - start)
+        if self.convergence is not None:
+            start = time.perf_counter()
+            self.convergence.observe(self)
+            timer.add('convergence.observe', time.perf_counter() - start)
+
+        start = time.perf_counter()
         self.schedule.finalize()
+        timer.add('schedule.finalize', time.perf_counter() - start)
+
+    def enable_timing(self) -> 'PhaseTimer':
+        """ Starts timing the phases of every step, and returns the timer. The timed phases
+            can be read as a DataFrame with the get_dataframe method of the timer.
+        """
+        self.timer = PhaseTimer(self.num_neighbourhoods)
+        return self.timer
 
-    def run_model(self, T_onset=1000, T_record=1000) -> None:
+    def disable_timing(self) -> None:
+        """ Stops timing the phases of every step.
+        """
+        self.timer = None
+
+    @property
+    def observed(self) -> bool:
+        """ Returns whether the reporters of the model are read in the current step, either by
+            the datacollector or by the convergence detector.
+        """
+        return self.record or self.convergence is not None
+
+    def run_model(self, T_onset=1000, T_record=1000, checkpoint_path: str = None,
+                  checkpoint_every: int = None,
+                  convergence: 'ConvergenceDetector' = None) -> None:
         """ Runs the model, given the parameters T_onset and T_record which represent the amount of
             'startup' steps (to get rid of startup anomalies) and recorded steps respectively.
+            If a checkpoint path and interval are passed, a checkpoint is saved every
+            checkpoint_every steps, from which the run can be resumed with resume_model.
+
+            If a convergence detector (see trust.convergence) is passed, T_onset and T_record
+            are the maximum number of steps: the onset ends once the model is stationary and
+            the recording once the estimates are precise enough. T_onset and T_record are then
+            set to the number of steps that were run.
+        """
+        self.T_onset = T_onset
+        self.T_record = T_record
+        self.run_steps = 0
+        self.convergence = convergence
+        self.resume_model(checkpoint_path, checkpoint_every)
+
+    def resume_model(self, checkpoint_path: str = None, checkpoint_every: int = None) -> None:
+        """ Continues the run started by run_model from the step it has reached, which is used
+            after loading a checkpoint. See run_model for the checkpoint parameters.
         """
         self.running = True
-        self.record = False
-        for _ in range(T_onset):
-            self.step()
-        self.record = True
-        for _ in range(T_record):
+        while self.run_steps < self.T_onset + self.T_record:
+            if self.run_steps == self.T_onset:
+                self.datacollector.reserve(self.T_record)
+            self.record = self.run_steps >= self.T_onset
             self.step()
+            self.run_steps += 1
+            if self.convergence is not None:
+                self.convergence.check(self)
+
+            if checkpoint_every and self.run_steps % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_path)
         self.running = False
 
+    def reseed(self, seed: int = None) -> None:
+        """ Replaces the random number generators by new ones with the passed seed, for instance
+            to let copies of the same model continue independently.
+        """
+        self.rng.seed(seed)
+        self.random = random.Random(seed)
+        self._seed = seed
+
+    def set_parameters(self, **params) -> None:
+        """ Changes parameters of a model that is already running. The mobility rate is set on
+            the model, other parameters (e.g. social_learning_rate) are set on every agent.
+        """
+        for name, value in params.items():
+            if name == 'mobility_rate':
+                self.mobility_rate = value
+                continue
+            for agent in self.schedule.agents:
+                if not hasattr(agent, name):
+                    raise ValueError(f'{name} is not a parameter of {type(agent).__name__}')
+                setattr(agent, name, value)
+
+    def save_checkpoint(self, path: str) -> None:
+        """ Saves the full state of the model to a gzipped pickle. This includes the agents,
+            network, random number generators and the data recorded so far. Data that has been
+            written to an attached store is flushed first, so the store matches the checkpoint.
+        """
+        if self.datacollector.store is not None:
+            self.datacollector.flush()
+        with gzip.open(path, 'wb', compresslevel=1) as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load_checkpoint(path: str) -> 'PDTModel':
+        """ Loads a model saved with save_checkpoint. The store of the datacollector is not
+            saved, and needs to be attached again.
+        """
+        with gzip.open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def __getstate__(self) -> dict:
+        """ Returns the state of the model for pickling. The MESA Model keeps its random number
+            generator on the class, so it is added to the state of the instance.
+        """
+        state = self.__dict__.copy()
+        state['random'] = self.random
+        return state
+
     def _market_size(self) -> float:
         """ Returns the percentage out of all agents which currently is in the global market.
         """
-        return len([a for a in self.schedule.agents if a.in_market]) / self.num_agents
+        return len(self.network.market) / self.num_agents
 
     def _trust_rate(self) -> float:
         """ Returns the percentage out of all agents which decided to play
             (so, trust) the prisoners' dilemma with the agent they have been matched with.
         """
-        a_paired = [a for a in self.schedule.agents if a.paired]
-        if len(a_paired) == 0:
+        counts = self.network.play_counts
+        if counts.paired == 0:
             return 0
-        return len([a for a in a_paired if a.play]) / len(a_paired)
+        return counts.playing / counts.paired
 
     def _cooperating_agents(self) -> float:
         """ Returns the percentage out of all agents that played the prisoners' dilemma with the
             agent they have been matched with and decided to cooperate.
         """
-        a_paired = [a for a in self.schedule.agents if a.paired]
-        if len(a_paired) == 0:
+        counts = self.network.play_counts
+        if counts.paired == 0:
             return 0
-        return len([a for a in a_paired if a.pdtchoice == PDTChoice.COOPERATE]) \
-            / len(a_paired)
+        return counts.cooperating / counts.paired
 
     def _trust_in_strangers(self) -> float:
         """ Returns the percentage out of all agents matched with a stranger that have decided
             to play (so, trust) the prisoners' dilemma with the agent they have been matched with.
         """
-        a_with_stranger_partners = [
-            a for a in self.schedule.agents if a.partner_is_stranger and a.paired]
-        if len(a_with_stranger_partners) == 0:
+        counts = self.network.play_counts
+        if counts.with_stranger == 0:
             return 0
-        return len([a for a in a_with_stranger_partners if a.play]) / len(a_with_stranger_partners)
+        return counts.trusting_stranger / counts.with_stranger
 
     def _trust_in_neighbors(self) -> float:
         """ Returns the percentage out of all agents matched with a neighbour that have decided
             to play (so, trust) the prisoners' dilemma with the agent they have been matched with.
         """
-        a_with_neighbor_partners = [
-            a for a in self.schedule.agents if (not a.in_market) and a.paired]
-        return len([a for a in a_with_neighbor_partners if a.play]) / len(a_with_neighbor_partners)
+        counts = self.network.play_counts
+        return counts.trusting_neighbour / counts.with_neighbour
 
     def _trust_in_newcomers(self) -> float:
         """ Returns the percentage out of all agents matched with a newcommer of the neighbourhood
             that have decided  to play (so, trust) the prisoners' dilemma with the agent they
             have been matched with.
         """
-        a_with_newcommers = [
-            a for a in self.schedule.agents if a.partner_is_newcomer and a.paired]
-        if len(a_with_newcommers) == 0:
+        counts = self.network.play_counts
+        if counts.with_newcomer == 0:
             return 0
-        return len([a for a in a_with_newcommers if a.play]) / len(a_with_newcommers)
+        return counts.trusting_newcomer / counts.with_newcomer
 
     def _signal_reading(self) -> float:
         """ Returns the mean value of the probability to trust another agent amongst all agents.
         """
-        return np.mean([a.trust_prob for a in self.schedule.agents])
+        return self.trust_prob_sum / self.num_agents
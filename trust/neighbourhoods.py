@@ -0,0 +1,74 @@
+""" This file contains the layouts with which the agents are distributed over the
+    neighbourhoods when a model is created. The layout is computed for all agents at once, as
+    an array with the neighbourhood of every agent, so large populations are built quickly.
+"""
+from typing import TYPE_CHECKING, Sequence, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from numpy.random import Generator
+
+# The layouts of the neighbourhood sizes, see assign_neighbourhoods
+LAYOUTS = ('equal', 'random', 'lognormal')
+
+
+def count_neighbourhoods(num_agents: int, neighbourhood_size: int,
+                         sizes: Union[str, Sequence[int]] = 'equal') -> int:
+    """ Returns the number of neighbourhoods: the number of passed sizes, or for a layout the
+        number of agents divided by the (mean) neighbourhood size, rounded down.
+    """
+    if isinstance(sizes, str):
+        return int(num_agents / neighbourhood_size)
+    return len(sizes)
+
+
+def lognormal_sizes(num_agents: int, num_neighbourhoods: int, generator: 'Generator',
+                    size_variation: float = 0.5) -> np.ndarray:
+    """ Draws the size of every neighbourhood from a lognormal distribution with the mean
+        neighbourhood size and the passed coefficient of variation (standard deviation over
+        mean). The sizes are rounded such that every neighbourhood has at least one agent and
+        the sizes sum to the number of agents, by distributing the agents left after giving
+        every neighbourhood one agent in proportion to the drawn sizes (largest remainder).
+    """
+    sigma = np.sqrt(np.log1p(size_variation ** 2))
+    mu = np.log(num_agents / num_neighbourhoods) - sigma ** 2 / 2
+    draws = generator.lognormal(mu, sigma, num_neighbourhoods)
+
+    shares = draws / draws.sum() * (num_agents - num_neighbourhoods)
+    sizes = np.floor(shares).astype(np.int64)
+    left = num_agents - num_neighbourhoods - sizes.sum()
+    sizes[np.argsort(sizes - shares, kind='stable')[:left]] += 1
+    return sizes + 1
+
+
+def assign_neighbourhoods(num_agents: int, num_neighbourhoods: int,
+                          sizes: Union[str, Sequence[int]] = 'equal',
+                          generator: 'Generator' = None,
+                          size_variation: float = 0.5) -> np.ndarray:
+    """ Returns the neighbourhood of every agent, as an array indexed by unique id. sizes is
+        either one of LAYOUTS or the size of every neighbourhood:
+        - 'equal' (default) distributes the agents round-robin, so the sizes differ by at most
+          one. No random numbers are drawn.
+        - 'random' puts every agent in a uniformly drawn neighbourhood, so the sizes are
+          binomially distributed and neighbourhoods may be empty.
+        - 'lognormal' draws the sizes from a lognormal distribution, see lognormal_sizes.
+        - A sequence of num_neighbourhoods sizes that sum to num_agents, e.g. drawn from any
+          other distribution.
+        Except for 'equal', the agents are put in the neighbourhoods in a random order, drawn
+        from the passed NumPy Generator.
+    """
+    if isinstance(sizes, str):
+        if sizes not in LAYOUTS:
+            raise ValueError(f'sizes={sizes} is not one of {LAYOUTS}')
+        if sizes == 'equal':
+            return np.arange(num_agents) % num_neighbourhoods
+        if sizes == 'random':
+            return generator.integers(0, num_neighbourhoods, num_agents)
+        sizes = lognormal_sizes(num_agents, num_neighbourhoods, generator, size_variation)
+
+    sizes = np.asarray(sizes, dtype=np.int64)
+    if len(sizes) != num_neighbourhoods or sizes.sum() != num_agents or (sizes < 0).any():
+        raise ValueError(f'The sizes of the {num_neighbourhoods} neighbourhoods should be '
+                         f'non-negative and sum to {num_agents} agents')
+    return generator.permutation(np.repeat(np.arange(num_neighbourhoods), sizes))
@@ -1,29 +1,40 @@
 """ This file contains the definition of the Neighbourhood and Network class, which holds
     information regarding the neighbourhoods and agents and their location respectively.
 """
-from typing import TYPE_CHECKING
+import time
+from operator import attrgetter
+from typing import TYPE_CHECKING, Iterable, Optional
+
+import numpy as np
+
+from trust import kernels
+from trust.agent import BaseAgent, MSAgent, WHAgent
+from trust.choice import PDTChoice
 
 if TYPE_CHECKING:
-    from trust.agent import BaseAgent
     from trust.model import PDTModel
+    from trust.timing import PhaseTimer
 
 
-class Neighbourhood(set):
-    """ Defines the neighbourhood. 
+class Neighbourhood(list):
+    """ Defines the neighbourhood, as a list of its agents. The agents are added and removed
+        by the network, which keeps the position of every agent in the list.
     """
-    def __init__(self) -> None:
-        """ Initializes the neighbourhood as a set. Sets the role model to none. 
+    def __init__(self, agents: 'Iterable[BaseAgent]' = ()) -> None:
+        """ Initializes the neighbourhood as a list of the passed agents. Sets the role model
+            to none.
         """
-        super().__init__()
+        super().__init__(agents)
         self.role_model = None
 
     def set_role_model(self):
         """ Updates the neighbourhoods role model. This role model is chosen
             to be the neighbourhoods most successfull agent considering their
-            cumulative payoff.
+            cumulative payoff. Ties are broken by the lowest unique id, so the
+            choice does not depend on the order of the agents in the list.
         """
-        def _cumulative_payoff(agent: 'BaseAgent') -> int:
-            return agent.cumulative_payoff
+        def _cumulative_payoff(agent: 'BaseAgent') -> 'tuple[float, int]':
+            return agent.cumulative_payoff, -agent.unique_id
         if len(self) > 0:
             self.role_model = max(self, key=_cumulative_payoff)
 
@@ -36,9 +47,98 @@ class Neighbourhood(set):
         return self.role_model
 
 
+class PlayCounts:
+    """ Counts the decisions of the agents that have been paired in the current step. The
+        model reporters are computed from these counts, instead of from all agents.
+    """
+    __slots__ = ('paired', 'playing', 'cooperating', 'with_stranger', 'trusting_stranger',
+                 'with_neighbour', 'trusting_neighbour', 'with_newcomer', 'trusting_newcomer')
+
+    def __init__(self) -> None:
+        """ Initializes all counts to zero.
+        """
+        self.reset()
+
+    def reset(self) -> None:
+        """ Resets all counts to zero.
+        """
+        for count in self.__slots__:
+            setattr(self, count, 0)
+
+    def count(self, agent: 'BaseAgent') -> None:
+        """ Counts the decisions of an agent that has decided whether to play.
+        """
+        play = agent.play
+        self.paired += 1
+        self.playing += play
+        self.cooperating += agent.pdtchoice == PDTChoice.COOPERATE
+        if agent.partner_is_stranger:
+            self.with_stranger += 1
+            self.trusting_stranger += play
+        if not agent.in_market:
+            self.with_neighbour += 1
+            self.trusting_neighbour += play
+        if agent.partner_is_newcomer:
+            self.with_newcomer += 1
+            self.trusting_newcomer += play
+
+    def count_arrays(self, play: np.ndarray, cooperates: np.ndarray, stranger: np.ndarray,
+                     in_market: np.ndarray, newcomer: np.ndarray) -> None:
+        """ Counts the decisions of a set of agents at once, given as arrays of the decision to
+            play, to cooperate, and whether their partner is a stranger or a newcomer.
+        """
+        neighbour = ~in_market
+        self.paired += len(play)
+        self.playing += int(np.count_nonzero(play))
+        self.cooperating += int(np.count_nonzero(cooperates))
+        self.with_stranger += int(np.count_nonzero(stranger))
+        self.trusting_stranger += int(np.count_nonzero(play & stranger))
+        self.with_neighbour += int(np.count_nonzero(neighbour))
+        self.trusting_neighbour += int(np.count_nonzero(play & neighbour))
+        self.with_newcomer += int(np.count_nonzero(newcomer))
+        self.trusting_newcomer += int(np.count_nonzero(play & newcomer))
+
+
+def _append(members: list, positions: 'list[int]', agent: 'BaseAgent') -> None:
+    """ Appends the agent to the member list and stores its position.
+    """
+    positions[agent.unique_id] = len(members)
+    members.append(agent)
+
+
+def _swap_remove(members: list, positions: 'list[int]', agent: 'BaseAgent') -> None:
+    """ Removes the agent from the member list in constant time, by moving the last member
+        into its position.
+    """
+    last = members.pop()
+    if last is not agent:
+        position = positions[agent.unique_id]
+        members[position] = last
+        positions[last.unique_id] = position
+
+
+def _swap_halves(values: np.ndarray) -> np.ndarray:
+    """ Returns the array with its first and second half swapped.
+    """
+    half = len(values) // 2
+    return np.concatenate((values[half:], values[:half]))
+
+
 class Network:
     """ Defines the Network, containing the model, global market and neighbourhoods.
+
+        The agents are addressed by their unique id. For every agent, the network keeps its
+        neighbourhood, whether it is in the market and its positions in the member lists, so
+        agents are added and removed in constant time without hashing. Next to the list of all
+        agents of a neighbourhood, the agents of a neighbourhood that are not in the market are
+        kept in a list of their own, which is the pairing input of the neighbourhood.
+
+        For agents that decide as the MSAgent or WHAgent, the pairs are played at once by the
+        array kernels (see trust.kernels), and only the outcome is written to the agents.
     """
+    # Below this number of agents, the overhead of the kernels outweighs playing pair by pair
+    KERNEL_MIN_AGENTS = 64
+
     def __init__(self, model: 'PDTModel', num_neighbourhoods) -> None:
         """ Initializes the Network. Takes the model and the amount of neighbourhoods as parameters.
             The market, is initialized as an empty neighbourhood. The networks neighbourhoods parameter,
@@ -49,29 +149,112 @@ class Network:
         self.market = Neighbourhood()
         self.neighbourhoods = [Neighbourhood()
                                for _ in range(self.num_neighbourhoods)]
+        self.local_agents: 'list[list[BaseAgent]]' = [[] for _ in range(self.num_neighbourhoods)]
+        # The role model of every neighbourhood, set once per step in pair_and_play
+        self.role_models: 'list[Optional[BaseAgent]]' = [None] * self.num_neighbourhoods
+        self.play_counts = PlayCounts()
+        self.payoff_matrix = kernels.payoff_matrix(model._PDT_PAYOFF)
+        # Whether the agents of a class read signals, or None if the kernels do not apply
+        self._reads_signals: 'dict[type, Optional[bool]]' = {}
+
+        # Indexed by the unique id of the agents, -1 if the agent is not in the network
+        self._neighbourhood_of: 'list[int]' = []
+        self._in_market: 'list[bool]' = []
+        # Position in the neighbourhood, and in either the local agents or the market
+        self._nbh_position: 'list[int]' = []
+        self._group_position: 'list[int]' = []
+
+    def _register(self, unique_id: int) -> None:
+        """ Extends the arrays indexed by unique id, so they include the passed id.
+        """
+        missing = unique_id + 1 - len(self._neighbourhood_of)
+        if missing > 0:
+            self._neighbourhood_of.extend([-1] * missing)
+            self._in_market.extend([False] * missing)
+            self._nbh_position.extend([-1] * missing)
+            self._group_position.extend([-1] * missing)
 
     def add_agent_to_neighbourhood(self, agent: 'BaseAgent', neighbourhood: int):
         """ Removes an agent (as specified in the passed agent parameter) from its current
             neighbourhood and adds it to the new neighbouhood as specified in the passed
             neighbourhood parameter.
         """
-        old_nbh = agent.neighbourhood
-        self.neighbourhoods[old_nbh].discard(agent)
+        self._register(agent.unique_id)
+        in_market = self._in_market[agent.unique_id]
+        old_nbh = self._neighbourhood_of[agent.unique_id]
+        if old_nbh >= 0:
+            _swap_remove(self.neighbourhoods[old_nbh], self._nbh_position, agent)
+            if not in_market:
+                _swap_remove(self.local_agents[old_nbh], self._group_position, agent)
 
-        self.neighbourhoods[neighbourhood].add(agent)
+        _append(self.neighbourhoods[neighbourhood], self._nbh_position, agent)
+        if not in_market:
+            _append(self.local_agents[neighbourhood], self._group_position, agent)
+        self._neighbourhood_of[agent.unique_id] = neighbourhood
         agent.neighbourhood = neighbourhood
 
+    def add_agents(self, agents: 'list[BaseAgent]', neighbourhoods: np.ndarray) -> None:
+        """ Adds the agents, which are not in the network yet, to their neighbourhoods at
+            once, in the passed array of the neighbourhood of every agent. The agents end up
+            in the same positions as when added one by one with add_agent_to_neighbourhood.
+        """
+        if len(agents) == 0:
+            return
+        unique_ids = np.fromiter((agent.unique_id for agent in agents), dtype=np.int64,
+                                 count=len(agents))
+        self._register(int(unique_ids.max()))
+        if any(self._neighbourhood_of[unique_id] >= 0 for unique_id in unique_ids.tolist()):
+            raise ValueError('Some of the agents are in the network already')
+
+        # Sorted by neighbourhood, and in the order of the passed agents within one
+        order = np.argsort(neighbourhoods, kind='stable')
+        nbh_sorted = neighbourhoods[order]
+        starts = np.searchsorted(nbh_sorted, np.arange(self.num_neighbourhoods + 1))
+        offsets = np.array([len(nbh) for nbh in self.neighbourhoods])
+        local_offsets = np.array([len(local) for local in self.local_agents])
+
+        # The position of the agent in the sorted order, minus the start of its neighbourhood
+        rank = np.arange(len(agents)) - starts[nbh_sorted]
+        ids_sorted = unique_ids[order]
+        nbh_position = np.asarray(self._nbh_position)
+        group_position = np.asarray(self._group_position)
+        nbh_position[ids_sorted] = offsets[nbh_sorted] + rank
+        group_position[ids_sorted] = local_offsets[nbh_sorted] + rank
+        self._nbh_position = nbh_position.tolist()
+        self._group_position = group_position.tolist()
+        neighbourhood_of = np.asarray(self._neighbourhood_of)
+        neighbourhood_of[unique_ids] = neighbourhoods
+        self._neighbourhood_of = neighbourhood_of.tolist()
+
+        sorted_agents = [agents[i] for i in order.tolist()]
+        for nbh, (start, stop) in enumerate(zip(starts[:-1].tolist(), starts[1:].tolist())):
+            members = sorted_agents[start:stop]
+            self.neighbourhoods[nbh].extend(members)
+            self.local_agents[nbh].extend(members)
+        for agent, nbh in zip(agents, neighbourhoods.tolist()):
+            agent.neighbourhood = nbh
+
     def add_agent_to_market(self, agent: 'BaseAgent') -> None:
         """ Adds the agent passed in the parameters to the global market. Please note that the
             agent remains in the same neighbourhood.
         """
-        self.market.add(agent)
+        if self._in_market[agent.unique_id]:
+            return
+        self._in_market[agent.unique_id] = True
+        _swap_remove(self.local_agents[self._neighbourhood_of[agent.unique_id]],
+                     self._group_position, agent)
+        _append(self.market, self._group_position, agent)
 
     def remove_agent_from_market(self, agent: 'BaseAgent') -> None:
         """ Removes the agent passed in the parameters to the global market. Please note that the
             agent remains in the same neighbourhood.
         """
-        self.market.discard(agent)
+        if not self._in_market[agent.unique_id]:
+            return
+        self._in_market[agent.unique_id] = False
+        _swap_remove(self.market, self._group_position, agent)
+        _append(self.local_agents[self._neighbourhood_of[agent.unique_id]],
+                self._group_position, agent)
 
     def pair_and_play(self) -> None:
         """ For each neighbourhood, the role model is updated after which the prisoners'
@@ -79,14 +262,36 @@ class Network:
             to enter to global market. After this, the prisoners' dilemma is played for
             all agents that have decided to enter the global market. Note that an agent
             can only play in either their neighbourhood, or on the global market and not both.
+
+            While the model is observed, the decisions of the paired agents are counted. If
+            the model is timed, the prisoners' dilemma of every group is timed.
+        """
+        self.play_counts.reset()
+        timer = self.model.timer
+        if timer is not None:
+            return self._timed_pair_and_play(timer)
+
+        for i, (nbh, local_agents) in enumerate(zip(self.neighbourhoods, self.local_agents)):
+            nbh.set_role_model()
+            self.role_models[i] = nbh.role_model
+            self.play_PDT(local_agents)
+        self.play_PDT(self.market)
+
+    def _timed_pair_and_play(self, timer: 'PhaseTimer') -> None:
+        """ Executes pair_and_play, adding the time of play_PDT in every neighbourhood and
+            the market to the timer.
         """
-        for nbh in self.neighbourhoods:
+        for i, (nbh, local_agents) in enumerate(zip(self.neighbourhoods, self.local_agents)):
             nbh.set_role_model()
-            agents = [a for a in nbh if a not in self.market]
-            self.play_PDT(agents)
+            self.role_models[i] = nbh.role_model
+            start = time.perf_counter()
+            self.play_PDT(local_agents)
+            timer.add_group(i, time.perf_counter() - start, len(local_agents))
+        start = time.perf_counter()
         self.play_PDT(self.market)
+        timer.add_group(-1, time.perf_counter() - start, len(self.market))
 
-    def play_PDT(self, agentSet: 'set[BaseAgent]') -> None:
+    def play_PDT(self, agentSet: 'list[BaseAgent]') -> None:
         """ Randomly pairs all agents in the given agentset. Once the agents have been
             matched with an agent, both agents decide whether to cooporate or defect.
             After that, both agents decide whether to play the game, or exit. If both
@@ -96,8 +301,96 @@ class Network:
             If at least one of the agents decide to exit, both agents receive the exit
             payoff.
         """
+        if len(agentSet) < 2:
+            return
+        # The population consists of a single agent class
+        reads_signals = self._kernel_reads_signals(type(agentSet[0]))
+        if reads_signals is None or len(agentSet) < self.KERNEL_MIN_AGENTS:
+            self._play_PDT_agents(agentSet)
+        else:
+            self._play_PDT_kernel(agentSet, reads_signals)
+
+    def _kernel_reads_signals(self, AgentClass: type) -> Optional[bool]:
+        """ Returns whether agents of the class decide to play by reading signals (as the
+            WHAgent) or not (as the MSAgent), or None if they decide otherwise, in which case
+            the pairs are played agent by agent.
+        """
+        if AgentClass not in self._reads_signals:
+            reads_signals = None
+            if AgentClass.decide_cooperation is BaseAgent.decide_cooperation:
+                if AgentClass.decide_play is MSAgent.decide_play:
+                    reads_signals = False
+                elif AgentClass.decide_play is WHAgent.decide_play \
+                        and AgentClass.get_signal is WHAgent.get_signal \
+                        and AgentClass.signal_reading is WHAgent.signal_reading \
+                        and AgentClass.parochialism is WHAgent.parochialism:
+                    reads_signals = True
+            self._reads_signals[AgentClass] = reads_signals
+        return self._reads_signals[AgentClass]
+
+    def _play_PDT_kernel(self, agentSet: 'list[BaseAgent]', reads_signals: bool) -> None:
+        """ Plays the prisoners' dilemma for all pairs of the agentset at once. The decisions
+            and payoffs are computed by the array kernels, after which they are written to the
+            agents in a single pass.
+        """
+        rng = self.model.rng.generator
+        num_pairs = len(agentSet) // 2
+        order = rng.permutation(len(agentSet))[:2 * num_pairs].tolist()
+        # The first agents of the pairs are followed by the second agents of the pairs, so the
+        # arrays of the partners are the arrays with their halves swapped
+        agents = [agentSet[i] for i in order[0::2]] + [agentSet[i] for i in order[1::2]]
+        partners = agents[num_pairs:] + agents[:num_pairs]
+
+        num_agents = len(agents)
+        trust_prob = np.fromiter(map(attrgetter('trust_prob'), agents), float, num_agents)
+        trustworthiness = np.fromiter(map(attrgetter('trustworthiness_prob'), agents), float,
+                                      num_agents)
+        newcomer = np.fromiter(map(attrgetter('newcomer'), agents), bool, num_agents)
+        in_market = np.fromiter(map(attrgetter('in_market'), agents), bool, num_agents)
+
+        cooperates = rng.random(num_agents) < trustworthiness
+        partner_cooperates = _swap_halves(cooperates)
+        any_newcomer = newcomer | _swap_halves(newcomer)
+        stranger = any_newcomer | in_market
+        partner_is_newcomer = any_newcomer & ~in_market
+
+        play, trusting = kernels.decide_play(
+            rng, trust_prob, stranger, reads_signals,
+            _swap_halves(trustworthiness), partner_cooperates)
+        both_play = play & _swap_halves(play)
+        payoffs = kernels.pdt_payoffs(
+            self.payoff_matrix, cooperates, partner_cooperates, both_play,
+            self.model.get_opportunity_cost(len(agentSet)), self.model.exit_payoff)
+
+        if self.model.observed:
+            self.play_counts.count_arrays(play, cooperates, stranger, in_market,
+                                          partner_is_newcomer)
+
+        choices = (PDTChoice.DEFECT, PDTChoice.COOPERATE)
+        for agent, partner, cooperate, agent_play, agent_trusting, agent_stranger, \
+                agent_newcomer, payoff in zip(agents, partners, cooperates.tolist(),
+                                              play.tolist(), trusting.tolist(),
+                                              stranger.tolist(), partner_is_newcomer.tolist(),
+                                              payoffs.tolist()):
+            agent.paired = True
+            agent.exchange_partner = partner
+            agent.pdtchoice = choices[cooperate]
+            agent.play = agent_play
+            agent.partner_is_stranger = agent_stranger
+            agent.partner_is_newcomer = agent_newcomer
+            if reads_signals:
+                agent.read_signal = agent_trusting
+            agent.receive_payoff(payoff)
+
+    def _play_PDT_agents(self, agentSet: 'list[BaseAgent]') -> None:
+        """ Plays the prisoners' dilemma pair by pair, letting the agents decide by their
+            own methods.
+        """
+        # Shuffled as a copy, so the positions kept by the network remain valid
         agent_list = list(agentSet)
-        self.model.random.shuffle(agent_list)
+        self.model.rng.shuffle(agent_list)
+        counts = self.play_counts if self.model.observed else None
+        opportunity_cost = self.model.get_opportunity_cost(len(agent_list))
 
         for i in range(int(len(agent_list)/2)):
             agent_a = agent_list[2*i]
@@ -109,9 +402,11 @@ class Network:
             agent_a.decide_play(agent_b)
             agent_b.decide_play(agent_a)
 
+            if counts is not None:
+                counts.count(agent_a)
+                counts.count(agent_b)
+
             if agent_a.play and agent_b.play:
-                opportunity_cost = self.model.get_opportunity_cost(
-                    len(agent_list))
                 a_payoff = self.model.get_pdt_payoff(
                     (agent_a.pdtchoice, agent_b.pdtchoice), opportunity_cost)
                 b_payoff = self.model.get_pdt_payoff(
@@ -123,6 +418,11 @@ class Network:
                 agent_b.receive_payoff(self.model.exit_payoff)
 
     def get_role_model(self, neighbourhood: int) -> 'BaseAgent':
-        """ Returns role model of the neighbourhood as passed in the parameters.
+        """ Returns role model of the neighbourhood as passed in the parameters, looked up in
+            the role models set in pair_and_play.
         """
-        return self.neighbourhoods[neighbourhood].get_role_model()
+        role_model = self.role_models[neighbourhood]
+        if role_model is None:
+            role_model = self.neighbourhoods[neighbourhood].get_role_model()
+            self.role_models[neighbourhood] = role_model
+        return role_model
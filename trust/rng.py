@@ -0,0 +1,46 @@
+""" This file contains the random number service of the model. Agents draw their uniform
+    numbers one at a time from a Mersenne Twister, while arrays are drawn at once from a NumPy
+    Generator, as done by the vectorized engine and the array kernels.
+"""
+import random
+from typing import List
+
+import numpy as np
+
+
+class RandomStream:
+    """ Defines the random numbers of a model. random is the bound random method of a
+        random.Random, so a decision of an agent costs a single call into C, without any
+        Python code in between. The NumPy Generator is available for drawing arrays at once.
+        Both are seeded from the same seed, independently of each other.
+
+        The stream, including the state of both generators, can be pickled, so a
+        checkpointed run continues with the same numbers.
+    """
+    def __init__(self, seed: int = None) -> None:
+        """ Initializes the stream with generators seeded with the passed seed (default None,
+            for a seed taken from the operating system).
+        """
+        self.seed(seed)
+
+    def seed(self, seed: int = None) -> None:
+        """ Replaces the generators by new ones with the passed seed.
+        """
+        self.generator = np.random.default_rng(seed)
+        # A child of the seed, so the uniform numbers do not repeat those of the generator
+        child = np.random.SeedSequence(seed).spawn(1)[0]
+        self._random = random.Random(int.from_bytes(child.generate_state(4).tobytes(), 'little'))
+        # Returns the next uniform number in [0, 1)
+        self.random = self._random.random
+
+    def randint(self, a: int, b: int) -> int:
+        """ Returns a random integer in [a, b], including both end points, like
+            random.randint.
+        """
+        return a + int(self.random() * (b - a + 1))
+
+    def shuffle(self, x: List) -> None:
+        """ Shuffles the list in place, with a permutation drawn by the generator.
+        """
+        order = self.generator.permutation(len(x)).tolist()
+        x[:] = [x[i] for i in order]
@@ -0,0 +1,157 @@
+""" This file contains the result stores, to which the datacollector writes the recorded data
+    in chunks while the model is running. Parquet and HDF5 are optional and require pyarrow
+    and PyTables respectively. pandas is only imported to read a store or to open a Parquet
+    or HDF5 store, as the chunks written to a store are DataFrames already.
+"""
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class CSVStore:
+    """ Defines a store that appends every chunk to a single CSV file.
+    """
+    extension = '.csv'
+
+    def __init__(self, path: str, resume_at: int = None) -> None:
+        """ Initializes the store, truncating the file at the passed path. If resume_at is
+            passed, only the header and the first resume_at rows are kept instead.
+        """
+        self.path = path
+        lines = []
+        if resume_at is not None:
+            with open(self.path) as f:
+                lines = f.readlines()[:resume_at + 1]
+        with open(self.path, 'w') as f:
+            f.writelines(lines)
+        self._header = not lines
+
+    def write(self, df: 'pd.DataFrame') -> None:
+        """ Appends the chunk to the file. The header is only written with the first chunk.
+        """
+        df.to_csv(self.path, mode='a', header=self._header)
+        self._header = False
+
+    def read(self) -> 'pd.DataFrame':
+        """ Reads all chunks written so far.
+        """
+        import pandas as pd
+
+        return pd.read_csv(self.path, index_col=0)
+
+    def close(self) -> None:
+        """ Closes the store. Every chunk is already closed after writing.
+        """
+
+
+class ParquetStore:
+    """ Defines a store that writes every chunk to its own Parquet file in a directory, so the
+        chunks written before a run is killed remain readable.
+    """
+    extension = '.parquet'
+
+    def __init__(self, path: str, resume_at: int = None) -> None:
+        """ Initializes the store, creating the directory at the passed path and removing the
+            chunks of an earlier run. If resume_at is passed, the chunks holding the first
+            resume_at rows are kept instead.
+        """
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError('The parquet store requires pyarrow to be installed') from e
+
+        import pandas as pd
+
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self._chunks = 0
+        rows = 0
+        for file_name in sorted(os.listdir(self.path)):
+            if not file_name.endswith(self.extension):
+                continue
+            chunk_path = os.path.join(self.path, file_name)
+            if resume_at is None or rows >= resume_at:
+                os.remove(chunk_path)
+                continue
+            df = pd.read_parquet(chunk_path)
+            if rows + len(df) > resume_at:
+                df.head(resume_at - rows).to_parquet(chunk_path)
+            rows += len(df)
+            self._chunks += 1
+
+    def write(self, df: 'pd.DataFrame') -> None:
+        """ Writes the chunk to the next file of the directory.
+        """
+        df.to_parquet(os.path.join(self.path, f'part-{self._chunks:05d}{self.extension}'))
+        self._chunks += 1
+
+    def read(self) -> 'pd.DataFrame':
+        """ Reads all chunks written so far.
+        """
+        import pandas as pd
+
+        return pd.read_parquet(self.path).sort_index()
+
+    def close(self) -> None:
+        """ Closes the store. Every chunk is already closed after writing.
+        """
+
+
+class HDF5Store:
+    """ Defines a store that appends every chunk to a table in an HDF5 file.
+    """
+    extension = '.h5'
+    key = 'model_vars'
+
+    def __init__(self, path: str, resume_at: int = None) -> None:
+        """ Initializes the store, truncating the file at the passed path. If resume_at is
+            passed, only the first resume_at rows are kept instead.
+        """
+        try:
+            import tables  # noqa: F401
+        except ImportError as e:
+            raise ImportError('The hdf5 store requires PyTables to be installed') from e
+
+        import pandas as pd
+
+        self.path = path
+        if resume_at is None:
+            self._store = pd.HDFStore(self.path, mode='w')
+            return
+        self._store = pd.HDFStore(self.path, mode='a')
+        if self.key in self._store:
+            self._store.remove(self.key, start=resume_at)
+
+    def write(self, df: 'pd.DataFrame') -> None:
+        """ Appends the chunk to the table and flushes it to disk.
+        """
+        self._store.append(self.key, df)
+        self._store.flush()
+
+    def read(self) -> 'pd.DataFrame':
+        """ Reads all chunks written so far.
+        """
+        return self._store.select(self.key)
+
+    def close(self) -> None:
+        """ Closes the HDF5 file.
+        """
+        self._store.close()
+
+
+STORES = {
+    'csv': CSVStore,
+    'parquet': ParquetStore,
+    'hdf5': HDF5Store,
+}
+
+
+def open_store(path: str, store_format: str = 'csv', resume_at: int = None):
+    """ Opens a store of the passed format (csv, parquet or hdf5) at the passed path, of which
+        the extension is replaced by the extension of the format. If resume_at is passed, the
+        first resume_at rows of an existing store are kept, to continue a resumed run.
+    """
+    Store = STORES[store_format]
+    return Store(os.path.splitext(path)[0] + Store.extension, resume_at)
@@ -0,0 +1,85 @@
+""" This file contains the phase timer, with which the model measures the wall time spent in
+    every phase of a step. Timing is opt-in: without a timer, the model only checks whether
+    it has one once per phase.
+"""
+from typing import TYPE_CHECKING, Dict
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class PhaseTimer:
+    """ Defines a timer that accumulates the wall time and number of calls of every phase of
+        a step, e.g. 'schedule.step' or 'network.pair_and_play'. The prisoners' dilemma of
+        the agent engine is also timed per group: every neighbourhood, and the market.
+    """
+    def __init__(self, num_neighbourhoods: int) -> None:
+        """ Initializes a timer without any time measured, for a model with the passed number
+            of neighbourhoods.
+        """
+        self.num_neighbourhoods = num_neighbourhoods
+        self.reset()
+
+    def reset(self) -> None:
+        """ Removes all time measured so far.
+        """
+        self.times: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+
+        # The time, calls and total number of agents of play_PDT per group, the market last
+        self.group_times = np.zeros(self.num_neighbourhoods + 1)
+        self.group_calls = np.zeros(self.num_neighbourhoods + 1, dtype=np.int64)
+        self.group_agents = np.zeros(self.num_neighbourhoods + 1, dtype=np.int64)
+
+    def add(self, phase: str, elapsed: float) -> None:
+        """ Adds a call of the phase that took elapsed seconds.
+        """
+        self.times[phase] = self.times.get(phase, 0.) + elapsed
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def add_group(self, group: int, elapsed: float, num_agents: int) -> None:
+        """ Adds a call of play_PDT for the agents of a group, the neighbourhood with the
+            passed index or the market for -1, that took elapsed seconds.
+        """
+        self.group_times[group] += elapsed
+        self.group_calls[group] += 1
+        self.group_agents[group] += num_agents
+
+    def get_dataframe(self) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame with the number of calls, the total time and the mean
+            time per call (in seconds) of every phase, sorted by name so that the parts of a
+            phase (e.g. 'schedule.finalize.learner') follow the phase. If play_PDT was timed
+            per group, the totals of the neighbourhoods and the market are included as the
+            phases 'network.play_PDT.neighbourhoods' and 'network.play_PDT.market'.
+        """
+        import pandas as pd
+
+        calls = dict(self.calls)
+        times = dict(self.times)
+        if self.group_calls.any():
+            for phase, groups in (('network.play_PDT.neighbourhoods', slice(None, -1)),
+                                  ('network.play_PDT.market', slice(-1, None))):
+                calls[phase] = int(self.group_calls[groups].sum())
+                times[phase] = float(self.group_times[groups].sum())
+
+        df = pd.DataFrame({'calls': calls, 'total_s': times}).sort_index()
+        df.index.name = 'phase'
+        df['mean_s'] = df['total_s'] / df['calls']
+        return df
+
+    def get_group_dataframe(self) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame with the number of calls, the number of agents, the
+            total time and the time per agent (in seconds) of play_PDT for every
+            neighbourhood, and the market in the last row.
+        """
+        import pandas as pd
+
+        df = pd.DataFrame({
+            'calls': self.group_calls,
+            'agents': self.group_agents,
+            'total_s': self.group_times,
+        }, index=pd.Index(list(range(self.num_neighbourhoods)) + ['market'], name='group'))
+        df['s_per_agent'] = df['total_s'] / df['agents']
+        return df
@@ -0,0 +1,472 @@
+""" This file contains the vectorized engine of the PDTModel. Instead of one Python object per
+    agent, the state of the whole population is stored as NumPy arrays and every phase of a
+    step is executed as a batched array operation.
+"""
+from typing import TYPE_CHECKING, Sequence, Union
+
+import numpy as np
+
+import trust.agent as agent_module
+from trust import kernels, learning
+from trust.agent import BaseGossipAgent, GossipAgent, MSAgent, RLAgent, RLGossipAgent, WHAgent
+from trust.gossip import GossipStore
+from trust.model import PDTModel
+from trust.neighbourhoods import count_neighbourhoods
+from trust.rng import RandomStream
+
+if TYPE_CHECKING:
+    from numpy.random import Generator
+
+
+class Population:
+    """ Defines the population of the vectorized engine. Holds the state of all agents as
+        arrays indexed by the unique id of the agent, and takes the role of the scheduler
+        by executing the step and finalize phase for all agents at once.
+    """
+    def __init__(self, model: 'VectorizedPDTModel', AgentClass: type,
+                 learning_rate: float = None, discount_factor: float = 0.9,
+                 social_learning_rate: float = 0.5, relative_reward: bool = False,
+                 memory_size: int = None) -> None:
+        """ Initializes the population in the same way the BaseAgent initializes a single
+            agent: agents are distributed over the neighbourhoods in the layout of the model,
+            nobody is a newcomer and the propensities are drawn uniformly between 0.0 and 1.0.
+
+            Whether the agents decide to play by reading signals (WHAgent) or by their
+            propensity to play (MSAgent) is derived from the passed agent class, as well as
+            whether they learn by reinforcement learning (RLAgent) and gossip (GossipAgent).
+            The other parameters are those of the RLAgent and GossipAgent, and are only used
+            for these agents.
+        """
+        self.model = model
+        self.steps = 0
+        self.time = 0.
+
+        N = model.num_agents
+        self.num_agents = N
+        self.unique_ids = np.arange(N)
+        self.reads_signals = issubclass(AgentClass, WHAgent)
+
+        self.neighbourhood = model._assign_neighbourhoods()
+        self.newcomer = np.zeros(N, dtype=bool)
+
+        # Equivalent to the propensity to play or read signals
+        self.trust_prob = self.rng.random(N)
+        # Propensity to cooperate (over defect)
+        self.trustworthiness_prob = self.rng.random(N)
+        # Propensity to enter the open market
+        self.location_prob = self.rng.random(N)
+
+        self.social_learning_rate = 0.5
+        self.reinforcement = issubclass(AgentClass, RLAgent)
+        if self.reinforcement:
+            if learning_rate is None:
+                raise TypeError(f'{AgentClass.__name__} requires a learning_rate')
+            self.n_payoffs = np.zeros(N)
+
+            # The factor with which the previous cumulative reward is discounted
+            self.discount_factor = discount_factor
+            # The learning rate for the reinforcement learning mechanism
+            self.learning_rate = learning_rate
+            # The learning rate for social learning from the role model
+            self.social_learning_rate = social_learning_rate
+            # Whether or not to use the relative reward for learning
+            self.relative_reward = relative_reward
+
+        if issubclass(AgentClass, BaseGossipAgent):
+            if memory_size is None:
+                raise TypeError(f'{AgentClass.__name__} requires a memory_size')
+            # Only accessed for many agents at once, so without hash tables
+            model.gossip = GossipStore(N, memory_size, indexed=False)
+
+        self.play = np.ones(N, dtype=bool)
+        self.cooperate = np.ones(N, dtype=bool)
+        self.read_signal = np.zeros(N, dtype=bool)
+        self.in_market = np.zeros(N, dtype=bool)
+        self.paired = np.zeros(N, dtype=bool)
+        self.exchange_partner = np.full(N, -1)
+
+        self.partner_is_stranger = np.zeros(N, dtype=bool)
+        self.partner_is_newcomer = np.zeros(N, dtype=bool)
+
+        self.payoff = np.zeros(N)
+        self.cumulative_payoff = np.zeros(N)
+
+    @property
+    def rng(self) -> 'Generator':
+        """ Returns the NumPy Generator of the random stream of the model.
+        """
+        return self.model.rng.generator
+
+    def get_agent_count(self) -> int:
+        """ Returns the number of agents in the population.
+        """
+        return self.num_agents
+
+    def step(self) -> None:
+        """ Moves agents to a new neighbourhood with a probability as defined by the mobility
+            rate and lets every agent choose (based on the location probability) whether
+            to enter the global market. See BaseAgent.step and BaseAgent.move.
+        """
+        num_neighbourhoods = self.model.num_neighbourhoods
+
+        moving = self.rng.random(self.num_agents) < self.model.mobility_rate
+        new_nbh = self.rng.integers(0, num_neighbourhoods, np.count_nonzero(moving))
+        shifted = new_nbh >= self.neighbourhood[moving]
+        new_nbh[shifted] = (new_nbh[shifted] + 1) % (num_neighbourhoods - 1)
+        self.neighbourhood[moving] = new_nbh
+        self.newcomer = moving
+
+        self.in_market = self.rng.random(self.num_agents) < self.location_prob
+        self.time += .5
+
+    def decide_play(self, agents: np.ndarray, partners: np.ndarray) -> None:
+        """ Decides for all agents whether to play or exit the prisoners' dilemma with their
+            exchange partner. Also marks whether the partner is a newcomer or a stranger.
+            See BaseAgent.decide_play, MSAgent.decide_play and WHAgent.decide_play.
+
+            Gossiping agents that remember their partner, or of which the role model
+            remembers the partner, play on that memory instead. See
+            BaseGossipAgent.decide_play.
+        """
+        self.paired[agents] = True
+        self.exchange_partner[agents] = partners
+
+        newcomer = self.newcomer[partners] | self.newcomer[agents]
+        in_market = self.in_market[agents]
+        stranger = newcomer | in_market
+        self.partner_is_newcomer[agents] = newcomer & ~in_market
+        self.partner_is_stranger[agents] = stranger
+
+        gossip = self.model.gossip
+        if gossip is not None:
+            known, remembered = gossip.get_many(agents, partners)
+            role_models = self.model.network.role_models[self.neighbourhood[agents]]
+            advised = ~known & (role_models >= 0)
+            known[advised], remembered[advised] = gossip.get_many(role_models[advised],
+                                                                  partners[advised])
+            self.play[agents[known]] = remembered[known]
+            agents, partners, stranger = agents[~known], partners[~known], stranger[~known]
+
+        play, trusting = kernels.decide_play(
+            self.rng, self.trust_prob[agents], stranger, self.reads_signals,
+            self.trustworthiness_prob[partners], self.cooperate[partners])
+        self.play[agents] = play
+        if self.reads_signals:
+            self.read_signal[agents] = trusting
+
+    def receive_payoff(self, agents: np.ndarray, payoffs: np.ndarray) -> None:
+        """ Saves the payoffs of the current step and adds them to the cumulative payoffs.
+            Reinforcement learning agents discount their cumulative payoff and number of
+            payoffs instead. See RLAgent.receive_payoff.
+        """
+        self.payoff[agents] = payoffs
+        if self.reinforcement:
+            self.cumulative_payoff[agents] = \
+                payoffs + self.discount_factor * self.cumulative_payoff[agents]
+            self.n_payoffs[agents] = 1 + self.discount_factor * self.n_payoffs[agents]
+        else:
+            self.cumulative_payoff[agents] += payoffs
+
+    def stochastic_learning(self, prob: np.ndarray, payoff: np.ndarray,
+                            agents: np.ndarray) -> np.ndarray:
+        """ Calculates and returns the new values according to the stochastic learning rate
+            given the probabilities and payoffs of the passed agents. Reinforcement learning
+            agents learn with their learning rate, optionally from the reward relative to
+            their average reward. See RLAgent.stochastic_learning.
+        """
+        if not self.reinforcement:
+            return learning.stochastic_learning(prob, payoff)
+
+        if self.relative_reward:
+            n_payoffs = self.n_payoffs[agents]
+            relative = n_payoffs > 0
+            average = self.cumulative_payoff[agents] / np.where(relative, n_payoffs, 1)
+            payoff = np.where(relative, payoff - average, payoff)
+        return learning.reinforcement_learning(prob, payoff, self.learning_rate)
+
+    def update_propensity(self, action_prob_attr: str, action_test: np.ndarray,
+                          agents: np.ndarray, role_models: np.ndarray,
+                          social_learning: np.ndarray) -> None:
+        """ Updates the passed propensity of the passed agents according to the learning rate,
+            or copies it from their role model. See BaseAgent.update_propensity.
+
+            Agents finalize in the order of their unique id, so an agent copies the already
+            updated propensity of a role model with a lower id. As a role model never learns
+            socially from itself, its updated propensity does not depend on the copying.
+        """
+        prob = getattr(self, action_prob_attr)
+        payoff = self.payoff[agents]
+
+        learned = self.stochastic_learning(prob[agents], payoff, agents)
+        learned = np.where(action_test, learned,
+                           1 - self.stochastic_learning(1 - prob[agents], payoff, agents))
+
+        updated = prob.copy()
+        updated[agents] = learned
+        role_prob = np.where(role_models < agents, updated[role_models], prob[role_models])
+
+        copying = social_learning & \
+            (self.rng.random(len(agents)) < self.social_learning_rate)
+        updated[agents] = np.where(copying, role_prob, learned)
+        setattr(self, action_prob_attr, updated)
+
+    def update_behaviour(self, agents: np.ndarray) -> None:
+        """ Updates the propensities of the passed agents. See BaseAgent.update_behaviour and
+            WHAgent.update_behaviour for the actions on which the propensities are updated.
+        """
+        role_models = self.model.network.role_models[self.neighbourhood[agents]]
+        social_learning = (role_models >= 0) & (role_models != agents)
+        role_models = np.where(social_learning, role_models, agents)
+
+        def update(action_prob_attr, action_test):
+            self.update_propensity(action_prob_attr, action_test, agents,
+                                   role_models, social_learning)
+
+        update('location_prob', self.in_market[agents])
+        if self.reads_signals:
+            update('trustworthiness_prob', ~self.cooperate[agents])
+            update('trust_prob', self.read_signal[agents])
+        else:
+            update('trustworthiness_prob', self.cooperate[agents])
+            update('trust_prob', self.play[agents])
+
+    def memorize_trust(self, agents: np.ndarray) -> None:
+        """ Lets the passed agents that played with a partner that also played memorize
+            whether the encounter was positive. See BaseGossipAgent.memorize_trust.
+        """
+        partners = self.exchange_partner[agents]
+        played = self.play[agents] & self.play[partners]
+        self.model.gossip.memorize_many(agents[played], partners[played],
+                                        self.payoff[agents[played]] > 0)
+
+    def finalize(self) -> None:
+        """ Updates the behaviour of all paired agents, after which all agents are unpaired
+            and leave the global market. Gossiping agents first memorize their encounter.
+            Afterwards, it moves to the next step.
+        """
+        paired = np.flatnonzero(self.paired)
+        if self.model.gossip is not None:
+            self.memorize_trust(paired)
+        self.update_behaviour(paired)
+        self.paired[:] = False
+        self.in_market[:] = False
+        self.time += .5
+        self.steps += 1
+
+    @property
+    def trust_in_stranger(self) -> np.ndarray:
+        """ Returns for every agent whether it is matched with a stranger and decided
+            to participate in the prisoners dilemma.
+        """
+        return self.play & self.partner_is_stranger & self.paired
+
+    @property
+    def paired_with_stranger(self) -> np.ndarray:
+        """ Returns for every agent whether it is matched with a stranger.
+        """
+        return self.partner_is_stranger & self.paired
+
+
+class ArrayNetwork:
+    """ Defines the Network of the vectorized engine. Neighbourhood membership and the global
+        market are read from the arrays of the population, while the role model of every
+        neighbourhood is stored by the id of the agent (-1 if there is none).
+    """
+    def __init__(self, model: 'VectorizedPDTModel', num_neighbourhoods: int) -> None:
+        """ Initializes the ArrayNetwork. Takes the model and the amount of neighbourhoods as
+            parameters.
+        """
+        self.model = model
+        self.num_neighbourhoods = num_neighbourhoods
+        self.role_models = np.full(num_neighbourhoods, -1)
+
+        self.payoff_matrix = kernels.payoff_matrix(PDTModel._PDT_PAYOFF)
+
+    @property
+    def population(self) -> Population:
+        """ Returns the population of the model.
+        """
+        return self.model.schedule
+
+    def set_role_models(self) -> None:
+        """ Updates the role model of every non-empty neighbourhood to its agent with the
+            highest cumulative payoff. As agents only receive a payoff in either their
+            neighbourhood or the market, this equals setting the role model right before
+            playing in that neighbourhood.
+        """
+        nbh = self.population.neighbourhood
+        order = np.lexsort((-self.population.cumulative_payoff, nbh))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = nbh[order[1:]] != nbh[order[:-1]]
+        self.role_models[nbh[order[first]]] = order[first]
+
+    def pair_and_play(self) -> None:
+        """ Updates the role models, after which all agents are randomly paired with another
+            agent in their neighbourhood, or in the global market if they have entered it.
+            With an odd amount of agents in a neighbourhood or the market, one agent remains
+            unpaired. All pairs play the prisoners' dilemma at once.
+        """
+        population = self.population
+        self.set_role_models()
+
+        group = np.where(population.in_market, self.num_neighbourhoods,
+                         population.neighbourhood)
+        order = np.lexsort((self.model.rng.generator.random(len(group)), group))
+
+        sizes = np.bincount(group, minlength=self.num_neighbourhoods + 1)
+        starts = np.cumsum(sizes) - sizes
+        rank = np.arange(len(order)) - np.repeat(starts, sizes)
+        paired = order[rank < np.repeat(sizes - sizes % 2, sizes)]
+
+        agents_a = paired[0::2]
+        agents_b = paired[1::2]
+        opportunity_cost = self.model.get_opportunity_cost(sizes[group[agents_a]])
+        self.play_PDT(agents_a, agents_b, opportunity_cost)
+
+    def play_PDT(self, agents_a: np.ndarray, agents_b: np.ndarray,
+                 opportunity_cost: np.ndarray) -> None:
+        """ Lets all pairs of agents play the prisoners' dilemma. Both agents decide whether to
+            cooperate or defect, and then whether to play the game, or exit. If both agents
+            decide to play the game, the payoffs are looked up in the payoff matrix. If at
+            least one of the agents decides to exit, both agents receive the exit payoff.
+        """
+        population = self.population
+        rng = self.model.rng.generator
+
+        for agents in (agents_a, agents_b):
+            population.cooperate[agents] = \
+                rng.random(len(agents)) < population.trustworthiness_prob[agents]
+
+        population.decide_play(agents_a, agents_b)
+        population.decide_play(agents_b, agents_a)
+
+        both_play = population.play[agents_a] & population.play[agents_b]
+        coop_a = population.cooperate[agents_a]
+        coop_b = population.cooperate[agents_b]
+        exit_payoff = self.model.exit_payoff
+        population.receive_payoff(agents_a, kernels.pdt_payoffs(
+            self.payoff_matrix, coop_a, coop_b, both_play, opportunity_cost, exit_payoff))
+        population.receive_payoff(agents_b, kernels.pdt_payoffs(
+            self.payoff_matrix, coop_b, coop_a, both_play, opportunity_cost, exit_payoff))
+
+
+class VectorizedPDTModel(PDTModel):
+    """ Defines the PDTModel with the vectorized engine. The scheduler and network of the
+        PDTModel are replaced by a Population and an ArrayNetwork, so the step, pair_and_play
+        and finalize phases run as batched array operations. The behaviour of the supported
+        agents is reproduced statistically, not draw for draw.
+    """
+    # The name of the engine, see trust.engines
+    ENGINE = 'vectorized'
+    SUPPORTED_AGENTS = (MSAgent, WHAgent, RLAgent, GossipAgent, RLGossipAgent)
+    # The keyword arguments of the agent classes, which are passed on to the population
+    AGENT_ARGS = {
+        RLAgent: ('learning_rate', 'discount_factor', 'social_learning_rate', 'relative_reward'),
+        BaseGossipAgent: ('memory_size',),
+    }
+    PopulationClass = Population
+    NetworkClass = ArrayNetwork
+
+    def __init__(self, AgentClass: Union[str, type] = MSAgent, number_of_agents: int = 1000,
+                 neighbourhood_size: int = 50, mobility_rate: float = 0.2, seed: int = None,
+                 neighbourhood_sizes: Union[str, Sequence[int]] = 'equal',
+                 size_variation: float = 0.5, **kwargs) -> None:
+        """ Initializes the model with the same parameters as the PDTModel. The arrays are
+            drawn from the NumPy Generator of the random stream seeded with the passed seed.
+            kwargs are the keyword arguments of the agent class (see AGENT_ARGS).
+        """
+        if isinstance(AgentClass, str):
+            AgentClass = getattr(agent_module, AgentClass)
+        if AgentClass not in self.SUPPORTED_AGENTS:
+            raise ValueError(
+                f'AgentClass={AgentClass.__name__} is not supported by the {self.ENGINE} engine')
+        allowed = [name for cls, names in self.AGENT_ARGS.items()
+                   if issubclass(AgentClass, cls) for name in names]
+        unexpected = {name: value for name, value in kwargs.items() if name not in allowed}
+        if unexpected:
+            raise TypeError(f'Unexpected arguments for {AgentClass.__name__}: {unexpected}')
+
+        self.num_agents = number_of_agents
+        self.num_neighbourhoods = count_neighbourhoods(number_of_agents, neighbourhood_size,
+                                                       neighbourhood_sizes)
+        self.neighbourhood_sizes = neighbourhood_sizes
+        self.size_variation = size_variation
+        self.mobility_rate = mobility_rate
+        self.rng = RandomStream(seed)
+        # Created by the population of gossiping agents
+        self.gossip = None
+
+        self.schedule = self.PopulationClass(self, AgentClass, **kwargs)
+        self.network = self.NetworkClass(self, self.num_neighbourhoods)
+
+        self.record = False
+        self.convergence = None
+        self.datacollector = self._create_datacollector()
+
+    def set_parameters(self, **params) -> None:
+        """ Changes parameters of a model. The mobility rate is set on the model, other
+            parameters are set on the population.
+        """
+        for name, value in params.items():
+            if name == 'mobility_rate':
+                self.mobility_rate = value
+            elif hasattr(self.schedule, name):
+                setattr(self.schedule, name, value)
+            else:
+                raise ValueError(f'{name} is not a parameter of the population')
+
+    def _market_size(self) -> float:
+        """ Returns the percentage out of all agents which currently is in the global market.
+        """
+        return np.count_nonzero(self.schedule.in_market) / self.num_agents
+
+    def _trust_rate(self) -> float:
+        """ Returns the percentage out of all paired agents which decided to play.
+        """
+        population = self.schedule
+        return self._proportion(population.play, population.paired)
+
+    def _cooperating_agents(self) -> float:
+        """ Returns the percentage out of all paired agents which decided to cooperate.
+        """
+        population = self.schedule
+        return self._proportion(population.cooperate, population.paired)
+
+    def _trust_in_strangers(self) -> float:
+        """ Returns the percentage out of all agents matched with a stranger that have decided
+            to play.
+        """
+        population = self.schedule
+        return self._proportion(population.play, population.paired_with_stranger)
+
+    def _trust_in_neighbors(self) -> float:
+        """ Returns the percentage out of all agents matched with a neighbour that have decided
+            to play.
+        """
+        population = self.schedule
+        a_with_neighbor_partners = ~population.in_market & population.paired
+        return int(np.count_nonzero(population.play & a_with_neighbor_partners)) \
+            / int(np.count_nonzero(a_with_neighbor_partners))
+
+    def _trust_in_newcomers(self) -> float:
+        """ Returns the percentage out of all agents matched with a newcomer of the
+            neighbourhood that have decided to play.
+        """
+        population = self.schedule
+        return self._proportion(population.play,
+                                population.partner_is_newcomer & population.paired)
+
+    def _signal_reading(self) -> float:
+        """ Returns the mean value of the probability to trust another agent amongst all agents.
+        """
+        return np.mean(self.schedule.trust_prob)
+
+    @staticmethod
+    def _proportion(selected: np.ndarray, among: np.ndarray) -> float:
+        """ Returns the proportion of the agents in among that are also selected, or 0 if
+            there are no agents in among.
+        """
+        total = np.count_nonzero(among)
+        if total == 0:
+            return 0
+        return np.count_nonzero(selected & among) / total
@@ -0,0 +1,234 @@
+""" This file contains the benchmark suite, which times the construction of the PDTModel, the
+    phases of a step and the DataFrame exporters of the datacollector for a set of engines,
+    agent classes and population sizes. The results are stored as JSON, so the results of two
+    commits can be compared. The time of importing the modules that every (worker) process
+    imports is benchmarked as well, each in a fresh interpreter.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from trust.engines import ENGINES, create_model
+
+# The phases of a step, in the order in which the model runs them
+PHASES = ('schedule_step', 'pair_and_play', 'collect', 'finalize')
+# The DataFrame exporters of the datacollector, timed after the steps
+EXPORTERS = ('get_model_vars_dataframe', 'get_agent_props_dataframe')
+# The times of a benchmark, in seconds
+TIMES = tuple(name + '_s' for name in ('construct',) + PHASES + EXPORTERS + ('step',))
+# The modules of which the import is timed, and the heavy modules they should not import
+IMPORTS = ('run', 'utils.parse_args', 'trust.model', 'trust.engines', 'utils.sweep')
+HEAVY_MODULES = ('pandas', 'numba', 'mesa.datacollection', 'matplotlib', 'scipy')
+
+# Imports the module in a fresh interpreter and prints the time and the heavy modules imported
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'import_s': elapsed, 'heavy_modules': [m for m in {heavy} if m in sys.modules]}}))
+"""
+
+
+def git_commit() -> Dict[str, object]:
+    """ Returns the commit of the working directory and whether it has uncommitted changes,
+        or None for both if it is not a git repository.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': bool(status.strip())}
+
+
+def metadata(**settings) -> Dict[str, object]:
+    """ Returns the commit, the time and the machine of a benchmark run, together with the
+        passed settings of the run.
+    """
+    return {
+        **git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        **settings,
+    }
+
+
+def time_run(engine: str, model_args: dict, steps: int, warmup: int,
+             seed: int = None) -> Dict[str, float]:
+    """ Creates a model and runs it for warmup steps, after which steps recorded steps are
+        timed phase by phase. Returns the time of the construction and the exporters, and the
+        mean time per step of every phase, in seconds.
+    """
+    start = time.perf_counter()
+    model = create_model(engine=engine, seed=seed, **model_args)
+    timings = {'construct': time.perf_counter() - start}
+
+    model.run_model(T_onset=warmup, T_record=0)
+    model.record = True
+    model.datacollector.reserve(steps)
+
+    phases = (model.schedule.step, model.network.pair_and_play,
+              lambda: model.datacollector.collect(model), model.schedule.finalize)
+    totals = np.zeros(len(PHASES))
+    for _ in range(steps):
+        for i, phase in enumerate(phases):
+            start = time.perf_counter()
+            phase()
+            totals[i] += time.perf_counter() - start
+    timings.update(zip(PHASES, (totals / steps).tolist()))
+
+    # Agents that were never paired with a stranger have a proportion of 0/0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name in EXPORTERS:
+            start = time.perf_counter()
+            getattr(model.datacollector, name)()
+            timings[name] = time.perf_counter() - start
+    return timings
+
+
+def benchmark(engine: str, model_args: dict, steps: int = 10, warmup: int = 5,
+              repeats: int = 3, seed: int = 0) -> Dict[str, object]:
+    """ Runs time_run repeats times, each time with a new model, and returns the fastest time
+        of every measurement (in seconds), as the others are slowed down by the machine. Also
+        returns the steps and agent steps per second of a full step.
+    """
+    runs = [time_run(engine, model_args, steps, warmup, seed + r) for r in range(repeats)]
+    timings = {name: min(run[name] for run in runs) for name in runs[0]}
+    step = sum(timings[phase] for phase in PHASES)
+    return {
+        'engine': engine,
+        'agent_class': model_args['AgentClass'],
+        'N': model_args['number_of_agents'],
+        **{name + '_s': value for name, value in timings.items()},
+        'step_s': step,
+        'steps_per_s': 1 / step,
+        'agent_steps_per_s': model_args['number_of_agents'] / step,
+    }
+
+
+def time_import(module: str, repeats: int = 5) -> Dict[str, object]:
+    """ Imports the module in repeats fresh interpreters, started in the root of the
+        repository, and returns the fastest import time (in seconds) and the heavy modules
+        that the import pulled in.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = _IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    runs = [json.loads(subprocess.run([sys.executable, '-c', script], cwd=root,
+                                      capture_output=True, text=True, check=True).stdout)
+            for _ in range(repeats)]
+    return {
+        'module': module,
+        'import_s': min(run['import_s'] for run in runs),
+        'heavy_modules': runs[0]['heavy_modules'],
+    }
+
+
+def supports(engine: str, agent_class: str) -> bool:
+    """ Returns whether the engine supports the agent class. The agent engine supports all.
+    """
+    supported = getattr(ENGINES[engine], 'SUPPORTED_AGENTS', None)
+    return supported is None or agent_class in (cls.__name__ for cls in supported)
+
+
+def run_suite(configurations: List[dict], engines: List[str], steps: int = 10,
+              warmup: int = 5, repeats: int = 3, seed: int = 0, imports: List[str] = (),
+              verbose: bool = False) -> Dict[str, object]:
+    """ Runs benchmark for every model configuration (the model arguments without the seed)
+        on every engine that supports its agent class, and time_import for every module in
+        imports. Returns the results together with the metadata of the run, ready to be
+        saved as JSON.
+    """
+    results = []
+    for model_args in configurations:
+        for engine in engines:
+            if not supports(engine, model_args['AgentClass']):
+                continue
+            result = benchmark(engine, model_args, steps, warmup, repeats, seed)
+            if verbose:
+                print(f"{engine} {result['agent_class']} N={result['N']}: "
+                      f"{result['steps_per_s']:.2f} steps/s, "
+                      f"{result['agent_steps_per_s']:.0f} agent steps/s")
+            results.append(result)
+
+    import_results = []
+    for module in imports:
+        result = time_import(module)
+        if verbose:
+            print(f"import {module}: {1000 * result['import_s']:.1f} ms, "
+                  f"heavy modules {result['heavy_modules']}")
+        import_results.append(result)
+
+    return {
+        'metadata': metadata(steps=steps, warmup=warmup, repeats=repeats, seed=seed),
+        'results': results,
+        'imports': import_results,
+    }
+
+
+def save_results(suite: Dict[str, object], path: str) -> None:
+    """ Saves the results of run_suite as JSON.
+    """
+    with open(path, 'w') as f:
+        json.dump(suite, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, object]:
+    """ Loads the results saved with save_results.
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(baseline: Dict[str, object], current: Dict[str, object],
+                    threshold: float = 0.1) -> pd.DataFrame:
+    """ Compares the times of the current results to those of the baseline results, for the
+        benchmarks in both. Returns for every benchmark and measurement the ratio of the
+        current to the baseline time, and whether it is a regression: slower by more than the
+        threshold (default 10%).
+    """
+    keys = ['engine', 'agent_class', 'N']
+    df_baseline = pd.DataFrame(baseline['results']).set_index(keys)
+    df_current = pd.DataFrame(current['results']).set_index(keys)
+    measurements = [name for name in TIMES
+                    if name in df_current.columns and name in df_baseline.columns]
+
+    df_baseline, df_current = df_baseline.align(df_current, join='inner', axis=0)
+    df = pd.concat({
+        'baseline': df_baseline[measurements].stack(),
+        'current': df_current[measurements].stack(),
+    }, axis=1)
+    df.index.names = keys + ['measurement']
+    df['ratio'] = df['current'] / df['baseline']
+    df['regression'] = df['ratio'] > 1 + threshold
+    return df.reset_index()
+
+
+def compare_imports(baseline: Dict[str, object], current: Dict[str, object],
+                    threshold: float = 0.1) -> pd.DataFrame:
+    """ Compares the import times of the current results to those of the baseline results,
+        for the modules in both, in the same way as compare_results.
+    """
+    df = pd.concat({
+        'baseline': pd.DataFrame(baseline.get('imports', []), columns=['module', 'import_s'])
+                      .set_index('module')['import_s'],
+        'current': pd.DataFrame(current.get('imports', []), columns=['module', 'import_s'])
+                     .set_index('module')['import_s'],
+    }, axis=1, join='inner')
+    df['ratio'] = df['current'] / df['baseline']
+    df['regression'] = df['ratio'] > 1 + threshold
+    return df.reset_index()
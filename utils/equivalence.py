@@ -0,0 +1,162 @@
+""" This file contains the equivalence harness, which runs the PDTModel with a reference and an
+    alternative engine for many seeds over a grid of parameters, and tests whether both
+    engines give the same distribution of every model reporter.
+"""
+import time
+from multiprocessing import Pool
+from statistics import NormalDist
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from trust.engines import create_model
+from utils.replicates import replicate_means
+from utils.sweep import spawn_seeds
+
+
+def ks_test(a: np.ndarray, b: np.ndarray) -> Tuple[float, float]:
+    """ Returns the statistic and the asymptotic p-value of the two-sample Kolmogorov-Smirnov
+        test of whether the samples a and b are drawn from the same distribution. The p-value
+        uses the small sample correction of Stephens (1970).
+    """
+    a, b = np.sort(a), np.sort(b)
+    values = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, values, side='right') / len(a)
+    cdf_b = np.searchsorted(b, values, side='right') / len(b)
+    statistic = float(np.max(np.abs(cdf_a - cdf_b)))
+
+    en = np.sqrt(len(a) * len(b) / (len(a) + len(b)))
+    lam = (en + 0.12 + 0.11 / en) * statistic
+    if lam < 0.2:
+        # The series converges slowly, while the p-value is 1 up to many digits
+        return statistic, 1.
+    k = np.arange(1, 101)
+    p_value = 2 * np.sum((-1) ** (k - 1) * np.exp(-2 * k ** 2 * lam ** 2))
+    return statistic, float(min(max(p_value, 0.), 1.))
+
+
+def confidence_interval(values: np.ndarray, confidence: float) -> Tuple[float, float]:
+    """ Returns the lower and upper bound of the confidence interval of the mean of the
+        values, using the normal approximation.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half_width = z * values.std(ddof=1) / np.sqrt(len(values))
+    return values.mean() - half_width, values.mean() + half_width
+
+
+def run_seed(task: Tuple[str, dict, dict, int]) -> Tuple[Dict[str, float], float]:
+    """ Runs the model of an engine for a single seed. Returns the means of the model
+        reporters over the recorded steps, and the runtime of creating and running the model.
+    """
+    engine, model_args, run_args, seed = task
+    start = time.perf_counter()
+    model = create_model(engine=engine, seed=seed, **model_args)
+    model.run_model(**run_args)
+    return replicate_means(model), time.perf_counter() - start
+
+
+def compare(reference: pd.DataFrame, alternative: pd.DataFrame,
+            level: float) -> pd.DataFrame:
+    """ Compares the replicate means of every reporter (the columns) of the reference and
+        alternative engine. A reporter passes if the Kolmogorov-Smirnov test does not reject
+        equal distributions at the passed level, and the confidence intervals of the means at
+        a confidence of 1 - level overlap. Replicates of which the reporter is NaN are left
+        out.
+    """
+    rows = []
+    for name in reference.columns:
+        ref = reference[name].dropna().to_numpy()
+        alt = alternative[name].dropna().to_numpy()
+        statistic, p_value = ks_test(ref, alt)
+        ref_low, ref_high = confidence_interval(ref, 1 - level)
+        alt_low, alt_high = confidence_interval(alt, 1 - level)
+        overlap = ref_low <= alt_high and alt_low <= ref_high
+        rows.append({
+            'reporter': name,
+            'reference_mean': ref.mean(),
+            'alternative_mean': alt.mean(),
+            'reference_std': ref.std(ddof=1),
+            'alternative_std': alt.std(ddof=1),
+            'ci_overlap': overlap,
+            'ks_statistic': statistic,
+            'ks_pvalue': p_value,
+            'passed': overlap and p_value >= level,
+        })
+    return pd.DataFrame(rows)
+
+
+def compare_engines(model_args: dict, run_args: dict, cells: List[dict], replicates: int,
+                    reference: str = 'agent', alternative: str = 'vectorized',
+                    alpha: float = 0.05, workers: int = None, seed: int = None
+                    ) -> pd.DataFrame:
+    """ Runs the reference and alternative engine for the passed number of replicates in every
+        cell, a dict of parameters added to model_args (e.g. {'mobility_rate': 0.3}), in a
+        pool of workers (default: one per core). Both engines run the same seeds, derived
+        from the passed seed.
+
+        Returns the comparison of every reporter in every cell (see compare), with the
+        parameters of the cell and the speedup of the alternative engine. alpha is the
+        probability that any reporter in any cell fails while the engines are equivalent: it
+        is divided over all tests (Bonferroni).
+
+        The runtimes of the pool are distorted by the workers competing for the cores, so the
+        speedup is the ratio of the runtimes of the first seed of the cell, run once more by
+        both engines one after the other in this process.
+    """
+    tasks = [(engine, {**model_args, **cell}, run_args, replicate_seed)
+             for cell, cell_seed in zip(cells, spawn_seeds(seed, len(cells)))
+             for replicate_seed in spawn_seeds(cell_seed, replicates)
+             for engine in (reference, alternative)]
+    with Pool(workers) as pool:
+        results = pool.map(run_seed, tasks, chunksize=1)
+
+    # A step of both engines before they are timed, which e.g. loads the compiled kernels
+    for engine, cell_args, _, replicate_seed in tasks[:2]:
+        run_seed((engine, cell_args, {'T_onset': 1, 'T_record': 1}, replicate_seed))
+
+    comparisons = []
+    for c, cell in enumerate(cells):
+        cell_results = results[2 * replicates * c:2 * replicates * (c + 1)]
+        reference_results, alternative_results = cell_results[0::2], cell_results[1::2]
+        means = [pd.DataFrame([means for means, _ in engine_results])
+                 for engine_results in (reference_results, alternative_results)]
+        comparison = compare(*means, alpha / (len(cells) * means[0].shape[1]))
+        for name, value in reversed(list(cell.items())):
+            comparison.insert(0, name, value)
+        _, reference_runtime = run_seed(tasks[2 * replicates * c])
+        _, alternative_runtime = run_seed(tasks[2 * replicates * c + 1])
+        comparison['speedup'] = reference_runtime / alternative_runtime
+        comparisons.append(comparison)
+    return pd.concat(comparisons, ignore_index=True)
+
+
+def same_results(model_args: dict, run_args: dict, cells: List[dict],
+                 reference: str = 'vectorized', alternative: str = 'compiled',
+                 seed: int = 0) -> pd.DataFrame:
+    """ Runs the reference and alternative engine once in every cell with the same fixed seed,
+        and checks whether they record exactly the same value of every model reporter at
+        every step. Only engines that draw the same random numbers, as the vectorized and
+        compiled engine, give the same results.
+
+        Returns per cell and reporter the largest absolute difference and whether the values
+        are the same.
+    """
+    comparisons = []
+    for cell in cells:
+        model_vars = []
+        for engine in (reference, alternative):
+            model = create_model(engine=engine, seed=seed, **model_args, **cell)
+            model.run_model(**run_args)
+            model_vars.append(model.datacollector.get_model_vars_dataframe())
+        df_ref, df_alt = model_vars
+        for name in df_ref.columns:
+            ref = df_ref[name].to_numpy(dtype=float)
+            alt = df_alt[name].to_numpy(dtype=float)
+            comparisons.append({
+                **cell,
+                'reporter': name,
+                'max_difference': np.nanmax(np.abs(ref - alt), initial=0.),
+                'passed': np.array_equal(ref, alt, equal_nan=True),
+            })
+    return pd.DataFrame(comparisons)
@@ -3,8 +3,10 @@ from typing import List
 
 from utils.comp_range import Range
 
-run_keys = ['T_onset', 'T_record']
-save_keys = ['save_filename']
+run_keys = ['T_onset', 'T_record', 'checkpoint_path', 'checkpoint_every']
+option_keys = ['save_filename', 'replicates', 'store_format', 'flush_every', 'resume',
+               'converge', 'window', 'tolerance', 'target_se', 'timing', 'profile',
+               'profile_top', 'profile_stacks']
 
 
 def pop_keys(dict: dict, keys: List[str]):
@@ -16,12 +18,18 @@ def parse_args(print_args=False):
     parser = argparse.ArgumentParser(description='MAS for trust in exchange')
     parser.add_argument('-a', '--agent-class', dest='AgentClass', default='MSAgent',
                         choices=['MSAgent', 'WHAgent', 'RLAgent', 'GossipAgent', 'RLGossipAgent'])
+    parser.add_argument('-e', '--engine', default='agent', choices=['agent', 'vectorized', 'compiled'],
+                        help='Simulates every agent as an object, or the population as arrays')
     parser.add_argument('-m', '--mobility-rate', default=0.2,
                         type=float, choices=[Range(0.0, 1.0)])
     parser.add_argument('-N', '--number-of-agents', default=1000,
-                        type=int, choices=[Range(0, 10000)])
+                        type=int, choices=[Range(0, int(1e6))])
     parser.add_argument('-n', '--neighbourhood-size',
-                        default=30, type=int, choices=[Range(0, 10000)])
+                        default=30, type=int, choices=[Range(0, int(1e6))])
+    parser.add_argument('-ns', '--neighbourhood-sizes', default='equal', choices=['equal', 'random', 'lognormal'],
+                        help='Distributes the agents round-robin, over random neighbourhoods, or over lognormal sizes')
+    parser.add_argument('-sv', '--size-variation', default=0.5, type=float, choices=[Range(0.0, 10.0)],
+                        help='Coefficient of variation of the sizes, only for lognormal neighbourhood sizes')
 
     parser.add_argument('-l', '--learning-rate', default=0.02,
                         type=float, choices=[Range(0.0, 1.0)], help='Only for RLAgent and RLGossipAgent')
@@ -33,14 +41,44 @@ def parse_args(print_args=False):
                         type=bool, choices=[True, False], help='Only for RLAgent and RLGossipAgent')
 
     parser.add_argument('-ms', '--memory-size', default=25,
-                        type=bool, choices=[Range(0, 10000)], help='Only for GossipAgent and RLGossipAgent')
+                        type=int, choices=[Range(0, 10000)], help='Only for GossipAgent and RLGossipAgent')
+
+    parser.add_argument('-s', '--seed', default=None, type=int,
+                        help='Seed of the random number generator')
+    parser.add_argument('-R', '--replicates', default=1, type=int, choices=[Range(1, 10000)],
+                        help='Number of independently seeded replicates to run and aggregate')
 
     parser.add_argument('-t1', '--T_onset', default='100',
                         type=int, choices=[Range(0, int(1e6))])
     parser.add_argument('-t2', '--T_record', default='1000',
                         type=int, choices=[Range(1, int(1e6))])
+    parser.add_argument('--checkpoint', dest='checkpoint_path', default=None,
+                        help='Saves the state of the model to CHECKPOINT every CHECKPOINT_EVERY steps')
+    parser.add_argument('--checkpoint-every', default=None, type=int, choices=[Range(1, int(1e6))])
+    parser.add_argument('--converge', action='store_true',
+                        help='Ends the onset once the model is stationary, T_onset and T_record become maxima')
+    parser.add_argument('--window', default=100, type=int, choices=[Range(1, int(1e6))],
+                        help='Number of steps over which the convergence is tested')
+    parser.add_argument('--tolerance', default=0.01, type=float,
+                        help='Largest difference of the means of two windows to be stationary')
+    parser.add_argument('--target-se', default=None, type=float,
+                        help='Ends the recording once the standard errors are at most TARGET_SE')
+    parser.add_argument('--timing', action='store_true',
+                        help='Times every phase of a step, saved to /t_SAVE-FILENAME')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profiles the run with cProfile, saved to /p_SAVE-FILENAME as .prof, .json and .csv')
+    parser.add_argument('--profile-top', default=30, type=int, choices=[Range(1, 10000)],
+                        help='Number of functions by tottime and by cumtime in the profile summary')
+    parser.add_argument('--profile-stacks', action='store_true',
+                        help='Also samples the call stacks, saved to /p_SAVE-FILENAME as collapsed stacks (.folded)')
+    parser.add_argument('--resume', default=None,
+                        help='Loads the model from the checkpoint RESUME and continues its run')
     parser.add_argument('--save-filename', default='data.csv',
                         help='Saves to /m_SAVE-FILENAME and /a_SAVE-FILENAME')
+    parser.add_argument('--store-format', default='csv', choices=['csv', 'parquet', 'hdf5'],
+                        help='The extension of SAVE-FILENAME is replaced by that of the format')
+    parser.add_argument('--flush-every', default=None, type=int, choices=[Range(1, int(1e6))],
+                        help='Writes the recorded steps to /m_SAVE-FILENAME every FLUSH_EVERY steps')
 
     args = parser.parse_args()
 
@@ -54,14 +92,25 @@ def parse_args(print_args=False):
         del args.relative_reward
     if args.AgentClass not in ['GossipAgent', 'RLGossipAgent']:
         del args.memory_size
+    if args.neighbourhood_sizes != 'lognormal':
+        del args.size_variation
+
+    if (args.checkpoint_path is None) != (args.checkpoint_every is None):
+        raise ValueError('--checkpoint and --checkpoint-every must be passed together')
+
+    if args.target_se is not None and not args.converge:
+        raise ValueError('--target-se requires --converge')
+
+    if args.profile_stacks and not args.profile:
+        raise ValueError('--profile-stacks requires --profile')
 
     kwargs = vars(args)
 
     run_args = pop_keys(kwargs, run_keys)
-    save_filename = pop_keys(kwargs, save_keys)[save_keys[0]]
+    options = pop_keys(kwargs, option_keys)
 
     if print_args:
         print("Model params: " + str(kwargs))
         print("Run params: " + str(run_args))
 
-    return kwargs, run_args, save_filename
+    return kwargs, run_args, options
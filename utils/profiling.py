@@ -0,0 +1,174 @@
+""" This file contains the run profiler, which profiles a run of the model with cProfile and
+    writes the profile in machine-readable form: the .prof file, a summary of the top
+    functions as CSV and JSON and, optionally, the sampled call stacks in the collapsed
+    format read by flame graph tools.
+"""
+import cProfile
+import json
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class StackSampler:
+    """ Defines a sampling profiler, which counts the call stacks of the main thread every
+        interval seconds of CPU time. Uses the SIGPROF timer where the platform has one, and
+        otherwise a thread that samples the stack every interval seconds of wall time.
+    """
+    def __init__(self, interval: float = 0.001) -> None:
+        """ Initializes a sampler without any samples, which samples every interval seconds.
+        """
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._thread: threading.Thread = None
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _label(frame) -> str:
+        """ Returns the label of the function of a frame, as name (file:line).
+        """
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def _sample(self, frame) -> None:
+        """ Counts the call stack that ends in the passed frame, outermost function first.
+        """
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame))
+            frame = frame.f_back
+        self.counts[tuple(reversed(stack))] += 1
+
+    def _run_thread(self, thread_id: int) -> None:
+        """ Samples the stack of the thread until the sampler is stopped.
+        """
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self._sample(frame)
+
+    def start(self) -> None:
+        """ Starts sampling the main thread, from which the sampler must be started.
+        """
+        if hasattr(signal, 'setitimer'):
+            signal.signal(signal.SIGPROF, lambda signum, frame: self._sample(frame))
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run_thread,
+                                            args=(threading.get_ident(),), daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """ Stops sampling.
+        """
+        if self._thread is None:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        else:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def write_collapsed(self, path: str) -> None:
+        """ Writes the sampled stacks in the collapsed format: a line per stack with the
+            functions separated by semicolons, followed by the number of samples.
+        """
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(';'.join(label.replace(';', ',') for label in stack) + f' {count}\n')
+
+
+class RunProfiler:
+    """ Defines a profiler of a run, used as a context manager around the code to profile. The
+        code is profiled by cProfile and, if stacks is set, its call stacks are sampled at the
+        same time.
+    """
+    def __init__(self, stacks: bool = False, interval: float = 0.001) -> None:
+        """ Initializes the profiler. stacks is whether the call stacks are sampled, every
+            interval seconds.
+        """
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(interval) if stacks else None
+        self.wall_time: float = None
+
+    def __enter__(self) -> 'RunProfiler':
+        self._start = time.perf_counter()
+        if self.sampler is not None:
+            self.sampler.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.wall_time = time.perf_counter() - self._start
+
+    def get_dataframe(self) -> 'pd.DataFrame':
+        """ Creates a pandas DataFrame with the number of calls (and primitive, i.e.
+            non-recursive, calls), the total time spent in the function itself (tottime) and
+            including the functions it calls (cumtime) of every profiled function, sorted by
+            tottime.
+        """
+        import pandas as pd
+
+        rows = []
+        for (filename, line, name), (primitive_calls, calls, tottime, cumtime, _) \
+                in pstats.Stats(self.profile).stats.items():
+            rows.append({
+                'function': f'{name} ({os.path.basename(filename)}:{line})',
+                'file': filename,
+                'line': line,
+                'name': name,
+                'ncalls': calls,
+                'primitive_calls': primitive_calls,
+                'tottime': tottime,
+                'cumtime': cumtime,
+            })
+        df = pd.DataFrame(rows).sort_values('tottime', ascending=False, ignore_index=True)
+        df['tottime_percall'] = df['tottime'] / df['ncalls']
+        df['cumtime_percall'] = df['cumtime'] / df['primitive_calls']
+        return df
+
+    def summary(self, top: int = 30) -> Dict[str, object]:
+        """ Returns the wall time of the run and the top functions by tottime and by cumtime.
+        """
+        df = self.get_dataframe()
+        return {
+            'wall_time': self.wall_time,
+            'total_tottime': float(df['tottime'].sum()),
+            'by_tottime': df.head(top).to_dict(orient='records'),
+            'by_cumtime': df.sort_values('cumtime', ascending=False).head(top)
+                            .to_dict(orient='records'),
+        }
+
+    def save(self, path: str, top: int = 30) -> List[str]:
+        """ Writes the profile to path with the extension .prof, the summary of the top
+            functions to .json and the union of the top functions by tottime and cumtime to
+            .csv and, if the stacks are sampled, the collapsed stacks to .folded. Returns the
+            paths of the written files.
+        """
+        path = os.path.splitext(path)[0]
+        self.profile.dump_stats(path + '.prof')
+
+        with open(path + '.json', 'w') as f:
+            json.dump(self.summary(top), f, indent=2)
+
+        df = self.get_dataframe()
+        top_functions = set(df.head(top).index) | set(df.nlargest(top, 'cumtime').index)
+        df.loc[sorted(top_functions)].to_csv(path + '.csv', index=False)
+
+        paths = [path + extension for extension in ('.prof', '.json', '.csv')]
+        if self.sampler is not None:
+            self.sampler.write_collapsed(path + '.folded')
+            paths.append(path + '.folded')
+        return paths
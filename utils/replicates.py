@@ -0,0 +1,93 @@
+""" This file contains the replicate runner, which runs independently seeded replicates of a
+    single configuration of the model and aggregates the model reporters while running.
+"""
+from statistics import NormalDist
+from typing import TYPE_CHECKING, Dict, List
+
+import numpy as np
+
+import trust.agent as agent_module
+from trust.engines import create_model
+from utils.sweep import spawn_seeds
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class RunningStatistics:
+    """ Accumulates the mean and variance of a vector of values over replicates with Welford's
+        algorithm, so the values of the individual replicates need not be kept.
+    """
+    def __init__(self, size: int) -> None:
+        """ Initializes the statistics of a vector of the passed size.
+        """
+        self.count = 0
+        self.mean = np.zeros(size)
+        self._m2 = np.zeros(size)
+
+    def update(self, values: np.ndarray) -> None:
+        """ Adds the values of a replicate to the statistics.
+        """
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (values - self.mean)
+
+    @property
+    def std(self) -> np.ndarray:
+        """ Returns the sample standard deviation (NaN for less than two replicates).
+        """
+        if self.count < 2:
+            return np.full(len(self.mean), np.nan)
+        return np.sqrt(self._m2 / (self.count - 1))
+
+    def confidence_interval(self, confidence: float = 0.95) -> 'tuple[np.ndarray, np.ndarray]':
+        """ Returns the lower and upper bound of the confidence interval of the mean, using the
+            normal approximation.
+        """
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * self.std / np.sqrt(self.count)
+        return self.mean - half_width, self.mean + half_width
+
+
+def replicate_means(model) -> Dict[str, float]:
+    """ Returns the mean over the recorded steps of every model reporter of a model that has
+        run, read directly from the datacollector without building a DataFrame.
+    """
+    model_vars = model.datacollector.model_vars
+    return {name: np.mean(values) for name, values in model_vars.items()}
+
+
+def run_replicates(replicates: int, seed: int = None, T_onset: int = 1000,
+                   T_record: int = 1000, confidence: float = 0.95, **model_args) -> 'pd.DataFrame':
+    """ Runs the passed number of replicates of the model, each with its own seed derived from
+        the passed seed. model_args are passed on to create_model. Only the running statistics
+        of the replicate means of the model reporters are kept.
+
+        Returns a DataFrame with the mean, standard deviation and confidence interval over the
+        replicates for every model reporter.
+    """
+    import pandas as pd
+
+    if isinstance(model_args.get('AgentClass'), str):
+        model_args['AgentClass'] = getattr(agent_module, model_args['AgentClass'])
+
+    reporters: List[str] = None
+    statistics: RunningStatistics = None
+    for replicate_seed in spawn_seeds(seed, replicates):
+        model = create_model(seed=replicate_seed, **model_args)
+        model.run_model(T_onset=T_onset, T_record=T_record)
+        means = replicate_means(model)
+
+        if statistics is None:
+            reporters = list(means)
+            statistics = RunningStatistics(len(reporters))
+        statistics.update(np.array([means[name] for name in reporters]))
+
+    ci_low, ci_high = statistics.confidence_interval(confidence)
+    return pd.DataFrame({
+        'mean': statistics.mean,
+        'std': statistics.std,
+        'ci_low': ci_low,
+        'ci_high': ci_high,
+    }, index=pd.Index(reporters, name='reporter'))
@@ -0,0 +1,115 @@
+""" This file contains the sweep runner, which runs the PDTModel for every cell of a grid of
+    neighbourhood sizes and mobility rates in a pool of worker processes. Cells that only
+    differ in parameters that can change after the onset can share a single onset, from which
+    the recording branches are cloned.
+"""
+import pickle
+from multiprocessing import Pool
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from trust.engines import create_model
+
+# The model reporters written (averaged over the recorded steps) to the .out file
+OUT_REPORTERS = ['Market_Size', 'Trust_in_Strangers', 'Signal_Reading', 'Trust_Rate',
+                 'Cooperating_Agents', 'Trust_in_Neighbors', 'Trust_in_Newcomers']
+
+
+def grid(n_min: int, n_max: int, n_stepsize: int, mob_rate_min: float, mob_rate_max: float,
+         mob_rate_stepsize: float) -> List[Tuple[float, float]]:
+    """ Returns all (neighbourhood size, mobility rate) cells of the grid, in the order in
+        which they are written to the .out files.
+    """
+    return [(n, mob_rate)
+            for n in np.arange(n_min, n_max + 0.001, n_stepsize)
+            for mob_rate in np.arange(mob_rate_min, mob_rate_max + 0.0001, mob_rate_stepsize)]
+
+
+def spawn_seeds(seed: int, num_seeds: int) -> List[int]:
+    """ Returns num_seeds independent seeds, derived from the passed seed (e.g. the seed of
+        the sweep). If the passed seed is None, the seeds are derived from fresh entropy.
+    """
+    children = np.random.SeedSequence(seed).spawn(num_seeds)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def run_cell(task: Tuple[dict, dict, int]) -> Tuple[List[float], np.ndarray]:
+    """ Runs the model for a single cell. Returns the results of cell_results.
+    """
+    model_args, run_args, seed = task
+    model = create_model(seed=seed, **model_args)
+    model.run_model(**run_args)
+    return cell_results(model)
+
+
+def cell_results(model) -> Tuple[List[float], np.ndarray]:
+    """ Returns the means of the model reporters in OUT_REPORTERS, and the trust in stranger
+        proportion of every agent of a model that has run.
+    """
+    df_m = model.datacollector.get_model_vars_dataframe()
+    df_a = model.datacollector.get_agent_props_dataframe()
+
+    means = [df_m[reporter].mean() for reporter in OUT_REPORTERS]
+    return means, df_a["Trust_in_Stranger_proportion"].to_numpy()
+
+
+def run_sweep(model_args: dict, run_args: dict, cells: List[Tuple[float, float]],
+              workers: int = None, seed: int = None
+              ) -> Iterator[Tuple[List[float], np.ndarray]]:
+    """ Runs the model for every cell in a pool of workers (default: one per core), and yields
+        the results of run_cell in the order of the cells.
+    """
+    tasks = [({**model_args, 'neighbourhood_size': n, 'mobility_rate': mob_rate},
+              run_args, cell_seed)
+             for (n, mob_rate), cell_seed in zip(cells, spawn_seeds(seed, len(cells)))]
+
+    with Pool(workers) as pool:
+        yield from pool.imap(run_cell, tasks, chunksize=1)
+
+
+def run_onset(task: Tuple[dict, int, int]) -> bytes:
+    """ Creates the model and runs its onset. Returns the pickled state of the model after the
+        onset, from which the branches are cloned.
+    """
+    model_args, T_onset, seed = task
+    model = create_model(seed=seed, **model_args)
+    model.run_model(T_onset=T_onset, T_record=0)
+    return pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def run_branch(task: Tuple[bytes, dict, int, int]) -> Tuple[List[float], np.ndarray]:
+    """ Clones the model from its state after the onset, changes its parameters and reseeds
+        it, after which it records the passed number of steps. Returns the results of
+        cell_results.
+    """
+    state, params, T_record, seed = task
+    model = pickle.loads(state)
+    model.set_parameters(**params)
+    model.reseed(seed)
+    model.run_model(T_onset=0, T_record=T_record)
+    return cell_results(model)
+
+
+def run_warm_start(onsets: List[Tuple[dict, List[dict]]], T_onset: int, T_record: int,
+                   workers: int = None, seed: int = None
+                   ) -> Iterator[Tuple[List[float], np.ndarray]]:
+    """ Runs every onset once, after which a branch is recorded for every dict of parameters
+        in its branches (e.g. {'mobility_rate': 0.3}). onsets is a list of the model
+        arguments of an onset and its branches. All onsets run in parallel in one pool of
+        workers (default: one per core), after which all branches of all onsets are
+        distributed over the same pool. Every onset and branch gets its own seed. Yields the
+        results of run_branch in the order of the onsets and their branches.
+    """
+    onset_tasks = []
+    branch_tasks = []
+    for (model_args, branches), onset_seed in zip(onsets, spawn_seeds(seed, len(onsets))):
+        onset_seed, *branch_seeds = spawn_seeds(onset_seed, 1 + len(branches))
+        onset_tasks.append((model_args, T_onset, onset_seed))
+        branch_tasks.append([(params, T_record, branch_seed)
+                             for params, branch_seed in zip(branches, branch_seeds)])
+
+    with Pool(workers) as pool:
+        states = pool.map(run_onset, onset_tasks, chunksize=1)
+        tasks = [(state, *task) for state, tasks in zip(states, branch_tasks) for task in tasks]
+        yield from pool.imap(run_branch, tasks, chunksize=1)